@@ -0,0 +1,139 @@
+from __future__ import annotations
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from Tabuleiro import Tabuleiro, Jogador, Peca
+from IA import IA_Minimax
+
+# analise em lote de posicoes gravadas, fora de uma partida
+# cada posicao é buscada por uma IA nova com o mesmo orcamento (profundidade e tempo), entao o resultado
+# nao depende da ordem nem de qual worker pegou ela. os resultados saem na ordem em que terminam,
+# cada um com o indice da posicao na entrada
+
+# posicoes na fila do pool por worker, pra uma entrada grande (ou um gerador) nao virar tudo tarefa de uma vez
+_TAREFAS_POR_WORKER = 4
+
+
+def movimento_para_dict(mv: Optional[Peca.Move]) -> Optional[Dict[str, Any]]:
+    if mv is None:
+        return None
+    if mv.tipo == "place":
+        return {"tipo": "place", "tamanho": int(mv.size), "destino": [mv.dst.linha, mv.dst.coluna]}
+    return {"tipo": "slide", "origem": [mv.org.linha, mv.org.coluna], "destino": [mv.dst.linha, mv.dst.coluna]}
+
+
+def analisar_posicao(texto: str, vez: int, profundidade: int = 4, limite_tempo: Optional[float] = None,
+                     config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # texto no formato do Tabuleiro.para_texto e vez 1 (jogador) ou 2 (IA). o score é do ponto de vista de quem joga
+    # posicao invalida nao levanta excecao, volta com "erro" pra nao derrubar o lote inteiro
+    resultado: Dict[str, Any] = {"posicao": texto, "vez": vez}
+    try:
+        if vez not in (1, 2):
+            raise ValueError(f"Vez invalida, esperava 1 ou 2: {vez!r}")
+        tab = Tabuleiro.de_texto(texto)
+    except (ValueError, TypeError, AttributeError) as e:
+        resultado["erro"] = str(e)
+        return resultado
+    if tab.ganhador() is not None:
+        resultado["erro"] = "Posicao ja tem vencedor"
+        return resultado
+
+    ia = IA_Minimax(**{**(config or {}), "profundidade_maxima": profundidade, "limite_tempo": limite_tempo, "verbose": False})
+    try:
+        mv, est = ia.buscar(tab, Jogador(vez))
+    finally:
+        ia.fechar()
+    resultado.update({
+        "movimento": movimento_para_dict(mv),
+        "score": est.score,
+        "nos": est.nos,
+        "profundidade": est.profundidade,
+        "tempo": est.tempo,
+        "timeout": est.timeout,
+        "origem": est.origem,
+    })
+    return resultado
+
+
+def _analisar(args: Tuple[int, str, int, int, Optional[float], Dict[str, Any]]) -> Dict[str, Any]:
+    indice, texto, vez, profundidade, limite_tempo, config = args
+    return {"indice": indice, **analisar_posicao(texto, vez, profundidade, limite_tempo, config)}
+
+
+def analisar(posicoes: Iterable[Tuple[str, int]], profundidade: int = 4, limite_tempo: Optional[float] = None,
+             workers: int = 1, config: Optional[Dict[str, Any]] = None,
+             pool: Optional[Executor] = None) -> Iterator[Dict[str, Any]]:
+    # gerador: (texto, vez) de cada posicao -> um dict por posicao assim que ela termina
+    # config sao os outros argumentos do IA_Minimax (tt_mb, tablebase, contempt...)
+    # com pool as posicoes vao pra ele (o servidor divide um pool so entre os pedidos) e workers é so quantas
+    # posicoes deste lote podem estar la ao mesmo tempo; sem pool, workers > 1 cria um pool so pra este lote
+    config = config or {}
+    tarefas = ((i, texto, vez, profundidade, limite_tempo, config) for i, (texto, vez) in enumerate(posicoes))
+    if pool is None and workers <= 1:
+        for t in tarefas:
+            yield _analisar(t)
+        return
+
+    proprio = pool is None
+    if proprio:
+        pool = ProcessPoolExecutor(max_workers=workers)
+    pendentes = set()
+    try:
+        for t in tarefas:
+            pendentes.add(pool.submit(_analisar, t))
+            if len(pendentes) >= workers * _TAREFAS_POR_WORKER:
+                prontas, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                for f in prontas:
+                    yield f.result()
+        while pendentes:
+            prontas, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+            for f in prontas:
+                yield f.result()
+    finally:
+        # quem consome parou no meio (cliente desconectou, por exemplo): o que ainda nao comecou é cancelado
+        if proprio:
+            pool.shutdown(wait=False, cancel_futures=True)
+        else:
+            for f in pendentes:
+                f.cancel()
+
+
+def _ler_posicoes(linhas: Iterable[str]) -> Iterator[Tuple[str, int]]:
+    # uma posicao por linha: "texto vez", linha vazia ou com # é ignorada
+    for linha in linhas:
+        linha = linha.strip()
+        if not linha or linha.startswith("#"):
+            continue
+        texto, _, vez = linha.partition(" ")
+        yield texto, int(vez) if vez.strip().isdigit() else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analisa um lote de posicoes e escreve um json por linha (ndjson)")
+    parser.add_argument("entrada", nargs="?", help="arquivo com uma posicao por linha ('texto vez'), sem ele le da entrada padrao")
+    parser.add_argument("--profundidade", type=int, default=4)
+    parser.add_argument("--tempo", type=float, default=None, help="limite de tempo por posicao em segundos")
+    parser.add_argument("--workers", type=int, default=1, help="posicoes analisadas em paralelo")
+    parser.add_argument("--tt-mb", type=float, default=16.0)
+    args = parser.parse_args()
+
+    entrada = open(args.entrada) if args.entrada else sys.stdin
+    t0 = time.perf_counter()
+    n = 0
+    try:
+        config = {"tt_mb": args.tt_mb}
+        for r in analisar(_ler_posicoes(entrada), args.profundidade, args.tempo, args.workers, config):
+            print(json.dumps(r), flush=True)
+            n += 1
+    finally:
+        if entrada is not sys.stdin:
+            entrada.close()
+    print(f"{n} posicoes em {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
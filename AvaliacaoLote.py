@@ -0,0 +1,75 @@
+from __future__ import annotations
+from typing import Sequence, Union
+
+try:
+    import numpy as np
+except ImportError: # numpy é opcional, so o modo de avaliacao em lote da IA precisa dele
+    np = None
+
+from Tabuleiro import Tabuleiro, Jogador, WIN_LINES
+
+# mesma heuristica do IA_Minimax._avaliar, mas pra um vetor de posicoes de uma vez com numpy
+# as posicoes vem no formato do Tabuleiro.codigo (6 mascaras de 9 bits num int)
+
+_LINHAS = [sum(1 << (pos.linha * 3 + pos.coluna) for pos in linha) for linha in WIN_LINES]
+_CENTRO = 4
+_POPCOUNT = np.array([bin(m).count("1") for m in range(1 << 9)], dtype=np.int8) if np is not None else None
+
+
+def numpy_disponivel() -> bool:
+    return np is not None
+
+
+def _pontuar(meu: "np.ndarray", dele: "np.ndarray") -> "np.ndarray":
+    # heuristica a partir das casas visiveis do max (meu) e do min (dele)
+    popcount = _POPCOUNT
+    # contagem por linha, shape (8, n)
+    linhas = np.array(_LINHAS, dtype=np.int32)[:, None]
+    c_max = popcount[meu[None, :] & linhas]
+    c_min = popcount[dele[None, :] & linhas]
+
+    score = (Tabuleiro.W_TWO_ALIGNED * ((c_max == 2) & (c_min == 0)).sum(axis=0)
+             + Tabuleiro.W_ONE_ALIGNED * ((c_max == 1) & (c_min == 0)).sum(axis=0)
+             - Tabuleiro.W_BLOCK_THREAT * ((c_min == 2) & (c_max == 0)).sum(axis=0)
+             - Tabuleiro.W_ONE_ALIGNED * ((c_min == 1) & (c_max == 0)).sum(axis=0)
+             + Tabuleiro.W_CENTER_BONUS * ((meu >> _CENTRO) & 1))
+
+    # vitoria: vale a primeira linha cheia na ordem do WIN_LINES, como no Tabuleiro.ganhador
+    cheia_max = c_max == 3
+    cheia_min = c_min == 3
+    alguma = cheia_max | cheia_min
+    tem_vencedor = alguma.any(axis=0)
+    primeira = alguma.argmax(axis=0)
+    max_ganhou = cheia_max[primeira, np.arange(len(meu))]
+    score = np.where(tem_vencedor, np.where(max_ganhou, Tabuleiro.WIN_SCORE, -Tabuleiro.WIN_SCORE), score)
+    return score.astype(np.float64)
+
+
+_TABELA = None
+
+
+def _tabela() -> "np.ndarray":
+    # o score so depende das casas visiveis dos dois, entao da pra calcular uma vez pra todos os 512 x 512 pares
+    # (2MB) e cada lote vira uma consulta. sem a tabela o custo fixo das ~40 operacoes do numpy por chamada
+    # comia o ganho nos lotes pequenos do ultimo ply
+    global _TABELA
+    if _TABELA is None:
+        pares = np.arange(1 << 18, dtype=np.int32)
+        _TABELA = _pontuar(pares >> 9, pares & 0x1FF)
+    return _TABELA
+
+
+def avaliar_lote(codigos: Union[Sequence[int], "np.ndarray"], max_player: Jogador) -> "np.ndarray":
+    if np is None:
+        raise ImportError("avaliar_lote precisa do numpy (pip install numpy)")
+    cods = np.asarray(codigos, dtype=np.uint64)
+    mascaras = [((cods >> np.uint64(k)) & np.uint64(0x1FF)).astype(np.int32) for k in range(0, 54, 9)]
+
+    # casas visiveis de cada jogador, igual o Tabuleiro.visiveis_de
+    p1, m1, g1, p2, m2, g2 = mascaras
+    g = g1 | g2
+    gm = g | m1 | m2
+    vis1 = g1 | (m1 & ~g) | (p1 & ~gm)
+    vis2 = g2 | (m2 & ~g) | (p2 & ~gm)
+    meu, dele = (vis1, vis2) if max_player == Jogador.JOGADOR else (vis2, vis1)
+    return _tabela()[meu << 9 | dele]
@@ -0,0 +1,229 @@
+from __future__ import annotations
+import argparse
+import json
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+from Tabuleiro import Tabuleiro, Jogador
+from IA import IA_Minimax
+
+# benchmark da busca com um corpus fixo de posicoes, pra dar pra comparar uma mudanca na IA com a anterior
+# mede nos/s, tempo ate cada profundidade, microbenchmarks do tabuleiro e pico de memoria,
+# salva tudo em json e compara com uma baseline salva, marcando o que piorou mais que o limiar
+
+# posicoes no formato do Tabuleiro.para_texto e quem joga (1=jogador, 2=IA)
+CORPUS: Dict[str, List[Tuple[str, int]]] = {
+    "abertura": [
+        ("-/-/-/-/-/-/-/-/-", 1),
+        ("-/-/-/-/1/-/-/-/-", 2),
+        ("1/-/-/-/-/-/-/-/-", 2),
+        ("-/-/-/-/-/3*/-/2/-", 1),
+    ],
+    "meio": [ # sem vitoria forcada ate a profundidade 4
+        ("3*/3/-/-/-/23*/-/-/-", 1),
+        ("-/-/-/3/3*/2*/-/-/3", 1),
+        ("3*/3/-/-/-/-/2/23*/-", 2),
+        ("-/-/-/3*/-/2/-/3/1", 2),
+    ],
+    # todas as pecas ja no tabuleiro. quase sempre alguem tem vitoria forcada perto, a busca termina cedo
+    "so_slide": [
+        ("-/2*/3*/-/1*3/1*2/123/12*/3*", 1),
+        ("123/12*3*/-/1*2/-/3/1*3*/-/2*", 1),
+        ("1*2*/2/123/3/13*/1*2*3*/-/-/-", 2),
+        ("-/1*2*/1*2*/-/123/123*/3*/3/-", 1),
+    ],
+}
+
+# metricas em que maior é melhor, o resto (tempos, memoria) menor é melhor
+_MAIOR_MELHOR = ("nos_por_segundo",)
+
+
+def carregar_corpus() -> Dict[str, List[Tuple[Tabuleiro, Jogador]]]:
+    return {grupo: [(Tabuleiro.de_texto(txt), Jogador(vez)) for txt, vez in posicoes]
+            for grupo, posicoes in CORPUS.items()}
+
+
+def _buscar(config: Dict[str, Any], tab: Tabuleiro, vez: Jogador, rodadas: int = 1) -> Tuple[float, int]:
+    # melhor tempo de algumas rodadas, cada uma com IA nova (tabela de transposicao vazia) pra todas medirem o mesmo
+    melhor = float("inf")
+    nos = 0
+    for _ in range(rodadas):
+        ia = IA_Minimax(**{**config, "verbose": False})
+        t0 = time.perf_counter()
+        ia.obter_melhor_movimento(tab, vez)
+        melhor = min(melhor, time.perf_counter() - t0)
+        ia.fechar()
+        nos = ia.nos_avaliados
+    return melhor, nos
+
+
+def medir_busca(corpus, config: Dict[str, Any], profundidade: int, rodadas: int = 3) -> Dict[str, Any]:
+    # todas as posicoes na mesma profundidade fixa, sem limite de tempo
+    resultado = {}
+    for grupo, posicoes in corpus.items():
+        tempo = 0.0
+        nos = 0
+        for tab, vez in posicoes:
+            t, n = _buscar({**config, "profundidade_maxima": profundidade, "limite_tempo": None}, tab, vez, rodadas)
+            tempo += t
+            nos += n
+        resultado[grupo] = {"tempo": tempo, "nos": nos, "nos_por_segundo": nos / tempo if tempo else 0.0}
+    return resultado
+
+
+def medir_tempo_ate_profundidade(corpus, config: Dict[str, Any], prof_max: int = 8, teto: float = 30.0,
+                                 rodadas: int = 3) -> Dict[str, Dict[str, Optional[float]]]:
+    # tempo de uma busca completa ate cada profundidade, somado nas posicoes do grupo
+    # quando uma profundidade passa do teto (por posicao) as seguintes ficam None, senao o benchmark nao termina
+    resultado: Dict[str, Dict[str, Optional[float]]] = {}
+    for grupo, posicoes in corpus.items():
+        tempos: Dict[str, Optional[float]] = {}
+        estourou = False
+        for prof in range(1, prof_max + 1):
+            if estourou:
+                tempos[str(prof)] = None
+                continue
+            total = 0.0
+            for tab, vez in posicoes:
+                t, _ = _buscar({**config, "profundidade_maxima": prof, "limite_tempo": teto}, tab, vez,
+                               rodadas if prof < prof_max else 1) # a ultima é a mais cara, uma rodada basta
+                total += t
+                if t >= teto:
+                    estourou = True
+                    break
+            tempos[str(prof)] = None if estourou else total
+        resultado[grupo] = tempos
+    return resultado
+
+
+def medir_micro(corpus, repeticoes: int = 2000) -> Dict[str, float]:
+    # microssegundos por chamada do Tabuleiro, media no corpus todo (melhor de 5 blocos)
+    tabs = [p for grupo in corpus.values() for p in grupo]
+    resultado = {}
+    for op, f in (
+        ("clone", lambda t, v: t.clone()),
+        ("movimentos_possiveis", lambda t, v: t.movimentos_possiveis(v)),
+        ("ganhador", lambda t, v: t.ganhador()),
+    ):
+        tempo = min(timeit.repeat(lambda: [f(t, v) for t, v in tabs], number=repeticoes // 5 or 1, repeat=5))
+        resultado[f"tabuleiro.{op}"] = tempo / ((repeticoes // 5 or 1) * len(tabs)) * 1e6
+    return resultado
+
+
+def medir_memoria(corpus, config: Dict[str, Any], profundidade: int) -> Dict[str, float]:
+    # pico de memoria alocada em python durante as buscas (tracemalloc), em MB
+    # a tabela de transposicao é criada dentro da medicao, entao o tamanho dela conta
+    resultado = {}
+    for grupo, posicoes in corpus.items():
+        tracemalloc.start()
+        for tab, vez in posicoes:
+            _buscar({**config, "profundidade_maxima": profundidade, "limite_tempo": None}, tab, vez)
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        resultado[grupo] = pico / (1024 * 1024)
+    return resultado
+
+
+def rodar(config: Dict[str, Any], profundidade: int = 4, prof_max: int = 8, teto: float = 30.0,
+          repeticoes: int = 2000, rodadas: int = 3) -> Dict[str, Any]:
+    corpus = carregar_corpus()
+    return {
+        "ambiente": {"python": sys.version.split()[0], "plataforma": platform.platform(), "maquina": platform.machine()},
+        "config": config,
+        "profundidade": profundidade,
+        "busca": medir_busca(corpus, config, profundidade, rodadas),
+        "tempo_ate_profundidade": medir_tempo_ate_profundidade(corpus, config, prof_max, teto, rodadas),
+        "micro_us": medir_micro(corpus, repeticoes),
+        "memoria_mb": medir_memoria(corpus, config, profundidade),
+    }
+
+
+def _achatar(d: Dict[str, Any], prefixo: str = "") -> Dict[str, float]:
+    plano = {}
+    for k, v in d.items():
+        nome = f"{prefixo}{k}"
+        if isinstance(v, dict):
+            plano.update(_achatar(v, nome + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            plano[nome] = float(v)
+    return plano
+
+
+def comparar(atual: Dict[str, Any], baseline: Dict[str, Any], limiar: float = 0.10,
+             tempo_minimo: float = 0.05) -> List[Dict[str, Any]]:
+    # lista das metricas que pioraram mais que o limiar (fracao) em relacao a baseline
+    # tempos da baseline abaixo de tempo_minimo segundos sao so ruido e ficam de fora
+    # contagem de nos nao é desempenho, mas se mudar a busca mudou, entao sai como aviso separado no main
+    metricas = ("busca", "tempo_ate_profundidade", "micro_us", "memoria_mb")
+    a = _achatar({k: atual[k] for k in metricas if k in atual})
+    b = _achatar({k: baseline[k] for k in metricas if k in baseline})
+    regressoes = []
+    for nome, antes in b.items():
+        depois = a.get(nome)
+        if depois is None or antes == 0 or nome.endswith(".nos"):
+            continue
+        if nome.startswith("busca.") and b.get(nome.rsplit(".", 1)[0] + ".tempo", tempo_minimo) < tempo_minimo:
+            continue
+        if nome.startswith("tempo_ate_profundidade.") and antes < tempo_minimo:
+            continue
+        if nome.endswith(_MAIOR_MELHOR):
+            piora = (antes - depois) / antes
+        else:
+            piora = (depois - antes) / antes
+        if piora > limiar:
+            regressoes.append({"metrica": nome, "baseline": antes, "atual": depois, "piora": piora})
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da IA com corpus fixo de posicoes")
+    parser.add_argument("--saida", default="benchmark.json", help="arquivo json com o resultado")
+    parser.add_argument("--baseline", help="json de uma execucao anterior pra comparar")
+    parser.add_argument("--limiar", type=float, default=0.10, help="piora maxima aceita antes de marcar regressao (0.10 = 10%%)")
+    parser.add_argument("--profundidade", type=int, default=4, help="profundidade da medicao de nos/s e memoria")
+    parser.add_argument("--prof-max", type=int, default=8, help="ultima profundidade do tempo ate profundidade")
+    parser.add_argument("--teto", type=float, default=30.0, help="segundos por busca antes de desistir das profundidades maiores")
+    parser.add_argument("--repeticoes", type=int, default=2000, help="repeticoes dos microbenchmarks")
+    parser.add_argument("--rodadas", type=int, default=3, help="cada busca roda isso de vezes e fica o melhor tempo")
+    parser.add_argument("--tt-mb", type=float, default=16.0)
+    args = parser.parse_args()
+
+    config = {"tt_mb": args.tt_mb}
+    r = rodar(config, args.profundidade, args.prof_max, args.teto, args.repeticoes, args.rodadas)
+    with open(args.saida, "w") as f:
+        json.dump(r, f, indent=2)
+
+    print(f"prof {args.profundidade}:")
+    for grupo, b in r["busca"].items():
+        print(f"  {grupo:<9} {b['nos']:>8} nos em {b['tempo']:.2f}s ({b['nos_por_segundo']:.0f} nos/s), "
+              f"pico {r['memoria_mb'][grupo]:.1f} MB")
+    print("tempo ate profundidade (s):")
+    for grupo, tempos in r["tempo_ate_profundidade"].items():
+        print(f"  {grupo:<9} " + " ".join(f"{p}:{t:.2f}" if t is not None else f"{p}:-" for p, t in tempos.items()))
+    print("micro (us por chamada):")
+    for op, us in r["micro_us"].items():
+        print(f"  {op:<32} {us:.2f}")
+    print(f"resultado em {args.saida}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for grupo, b in baseline.get("busca", {}).items():
+            atual = r["busca"].get(grupo)
+            if atual is not None and atual["nos"] != b["nos"]:
+                print(f"aviso: {grupo} mudou de {b['nos']} pra {atual['nos']} nos, a busca nao é mais a mesma")
+        regressoes = comparar(r, baseline, args.limiar)
+        if regressoes:
+            print(f"{len(regressoes)} regressoes acima de {args.limiar:.0%}:")
+            for reg in regressoes:
+                print(f"  {reg['metrica']}: {reg['baseline']:.3f} -> {reg['atual']:.3f} (+{reg['piora']:.0%})")
+            sys.exit(1)
+        print(f"sem regressoes acima de {args.limiar:.0%} em relacao a {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
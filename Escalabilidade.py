@@ -0,0 +1,77 @@
+from __future__ import annotations
+import argparse
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+from Tabuleiro import Tabuleiro, Jogador
+from IA import IA_Minimax
+
+# mede quanto a busca paralela (IA_Minimax com workers > 1) ganha de 1 ate N processos
+# roda as mesmas posicoes com profundidade fixa e sem limite de tempo, entao o tempo é o tempo ate a profundidade
+# eficiencia = aceleracao / workers, 1.0 seria escalar perfeito
+
+
+def posicoes_de_teste(quantidade: int, semente: int = 7) -> List[Tuple[Tabuleiro, Jogador]]:
+    # posicoes do meio do jogo, jogando alguns lances aleatorios desde o tabuleiro vazio
+    rng = random.Random(semente)
+    posicoes = []
+    while len(posicoes) < quantidade:
+        tab = Tabuleiro()
+        vez = Jogador.JOGADOR
+        for _ in range(rng.randint(2, 8)):
+            movimentos = tab.movimentos_possiveis(vez)
+            if not movimentos:
+                break
+            tab.aplicar_movimento(vez, rng.choice(movimentos))
+            vez = Jogador.IA if vez == Jogador.JOGADOR else Jogador.JOGADOR
+            if tab.ganhador() is not None:
+                break
+        if tab.ganhador() is None and tab.movimentos_possiveis(vez):
+            posicoes.append((tab, vez))
+    return posicoes
+
+
+def medir_escalabilidade(max_workers: int, profundidade: int = 4, quantidade: int = 12,
+                         paralelo: str = "smp", **opcoes: Any) -> List[Dict[str, Any]]:
+    posicoes = posicoes_de_teste(quantidade)
+    linhas: List[Dict[str, Any]] = []
+    for n in range(1, max_workers + 1):
+        ia = IA_Minimax(profundidade_maxima=profundidade, limite_tempo=None, workers=n, paralelo=paralelo, **opcoes)
+        nos = 0
+        t0 = time.perf_counter()
+        for tab, vez in posicoes:
+            ia.obter_melhor_movimento(tab, vez)
+            nos += ia.nos_avaliados
+        tempo = time.perf_counter() - t0
+        ia.fechar()
+        aceleracao = linhas[0]["tempo"] / tempo if linhas else 1.0
+        linhas.append({
+            "workers": n,
+            "tempo": tempo,
+            "nos": nos,
+            "nos_por_segundo": nos / tempo if tempo else 0.0,
+            "aceleracao": aceleracao,
+            "eficiencia": aceleracao / n,
+        })
+    return linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eficiencia da busca paralela da IA de 1 ate N workers")
+    parser.add_argument("--workers", type=int, default=4, help="maximo de processos")
+    parser.add_argument("--profundidade", type=int, default=4)
+    parser.add_argument("--posicoes", type=int, default=12, help="quantas posicoes de teste")
+    parser.add_argument("--modo", choices=("raiz", "smp"), default="smp", help="modo paralelo da IA")
+    args = parser.parse_args()
+
+    linhas = medir_escalabilidade(args.workers, args.profundidade, args.posicoes, args.modo)
+    print(f"modo {args.modo}, profundidade {args.profundidade}, {args.posicoes} posicoes")
+    print(f"{'workers':>7} {'tempo (s)':>10} {'nos':>10} {'nos/s':>10} {'acel.':>7} {'efic.':>7}")
+    for l in linhas:
+        print(f"{l['workers']:>7} {l['tempo']:>10.2f} {l['nos']:>10} {l['nos_por_segundo']:>10.0f} "
+              f"{l['aceleracao']:>7.2f} {l['eficiencia']:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,17 @@
 import math
 import time
-from typing import Optional
-from Tabuleiro import Tabuleiro, Jogador, Peca, Pos, Tamanho, WIN_LINES
+import random
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Optional, Dict, Any, List, Union, Tuple
+from Tabuleiro import Tabuleiro, Jogador, Peca, Pos, Tamanho, ZOBRIST_VEZ, chave_repeticao, canonizar_codigo, transformar_movimento, destransformar_movimento
+from Tabuleiro import AMEACAS, visiveis_de
+from Transposicao import TabelaTransposicao, EXATO, INFERIOR, SUPERIOR
+from TransposicaoCompartilhada import TabelaCompartilhada
+from Tablebase import Tablebase, VITORIA, DERROTA, EMPATE
+from LivroAberturas import LivroAberturas
+from AvaliacaoLote import avaliar_lote, numpy_disponivel
 
 #aqui utilizamos o esqueleto do algoritmo fornecido no moodle pelo professor na aula do dia 28/08
 #o algoritmo é o minimax com poda alfa beta
@@ -14,14 +24,179 @@ from Tabuleiro import Tabuleiro, Jogador, Peca, Pos, Tamanho, WIN_LINES
 #definimos tambem uma heuristica simples 
 #a ordenacao de movimentos é a de movimentos de place centrais no tabuleiro e pecas maiores
 
+# o score guardado na tabela de transposicao é sempre do ponto de vista do jogador_max
+# e a heuristica nao é simetrica (bonus do centro so pro max), entao a chave tambem leva quem é o max
+_rng = random.Random(2808)
+_ZOBRIST_MAX: Dict[Jogador, int] = {j: _rng.getrandbits(64) for j in Jogador}
+
+# com poucas pecas no tabuleiro (comeco do jogo) posicoes simetricas aparecem muito na arvore,
+# entao ate esse numero de pecas a tabela de transposicao usa a forma canonica da posicao como chave
+# depois disso é raro e canonizar em todo no custaria mais do que economiza
+_PECAS_SIMETRIA = 6
+_MULT_CHAVE = 0x9E3779B97F4A7C15
+_M64 = (1 << 64) - 1
+
+_PROFUNDIDADE_SEM_LIMITE = 64 # teto do aprofundamento iterativo quando profundidade_maxima é None (so o tempo limita)
+_MAX_MOVIMENTOS_RAIZ = 128    # 27 places + no maximo 6 origens x 8 destinos de slide, sobra espaco
+_NUM_INDICES_MOVIMENTO = 27 + 81 # ver _indice_movimento
+
+# largura da janela nula do pvs. os scores da heuristica andam de 10 em 10 (e o contempt é escolhido na mao),
+# entao qualquer coisa bem menor que isso separa "passou do alfa" de "nao passou"
+_JANELA_NULA = 1e-3
+# avaliacao_lote: no ultimo ply so vale mandar pro numpy a partir de tantos filhos (o lote tem ~40us de custo fixo).
+# no corpus do Benchmark (6 rodadas, melhor tempo): prof 5 0.93s -> 0.72s, prof 6 2.39s -> 2.16s, mesmos
+# movimentos e scores. avaliando todos os filhos de uma vez, sem deixar o primeiro cortar, era 0.69s -> 1.07s na prof 5
+_MIN_LOTE = 8
+# meia largura da janela de aspiracao da raiz (ver _raiz_aspiracao)
+_JANELA_ASPIRACAO = 40.0
+
+
+def _indice_movimento(mv: Peca.Move) -> int: # 0..26 place (tamanho, destino), 27..107 slide (origem, destino)
+    d = mv.dst.linha * 3 + mv.dst.coluna
+    if mv.tipo == "place":
+        return (mv.size - 1) * 9 + d
+    return 27 + (mv.org.linha * 3 + mv.org.coluna) * 9 + d
+
+
+# resumo de uma busca, devolvido junto com o movimento pelo IA_Minimax.buscar
+# avaliacoes_folha e cortes_por_indice so sao contados com IA_Minimax(estatisticas=True), no resto da IA
+# ficam zerados pra nao pesar na busca. na busca paralela eles so contam o que rodou no processo principal
+@dataclass
+class EstatisticasBusca:
+    nos: int = 0
+    avaliacoes_folha: int = 0
+    cortes_por_indice: List[int] = field(default_factory=list) # cortes beta pelo indice do movimento que cortou
+    taxa_corte_primeiro: float = 0.0 # fracao dos cortes que vieram do primeiro movimento, mede a ordenacao
+    nos_por_profundidade: List[int] = field(default_factory=list)      # de cada iteracao completa
+    tempo_por_profundidade: List[float] = field(default_factory=list)
+    fator_ramificacao: float = 0.0 # efetivo, nos da ultima iteracao / nos da penultima
+    profundidade: int = 0
+    timeout: bool = False
+    score: Optional[float] = None  # do movimento escolhido, do ponto de vista de quem joga
+    tempo: float = 0.0
+    origem: str = "busca"          # ou "tablebase", "livro"
+    tt: Optional[Dict[str, Any]] = None
+
+    def registrar_corte(self, indice: int) -> None:
+        while len(self.cortes_por_indice) <= indice:
+            self.cortes_por_indice.append(0)
+        self.cortes_por_indice[indice] += 1
+
+    def como_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def resumo(self) -> str:
+        if self.origem == "tablebase":
+            return f"Jogada da tablebase em {self.tempo:.4f}s"
+        if self.origem == "livro":
+            return f"Jogada do livro de aberturas em {self.tempo:.6f}s"
+        info_tt = ""
+        if self.tt is not None:
+            info_tt = f", tt: {self.tt['taxa_acerto']:.0%} acertos, {self.tt['taxa_corte']:.0%} cortes"
+        info_cortes = f", 1o corta {self.taxa_corte_primeiro:.0%}" if self.cortes_por_indice else ""
+        return f"Avaliados {self.nos} nós em {self.tempo:.2f}s (prof={self.profundidade}{info_tt}{info_cortes})"
+
 
 class IA_Minimax:
 
-    def __init__(self, profundidade_maxima: int = 4, limite_tempo: float = 30):
+    def __init__(self, profundidade_maxima: int = 4, limite_tempo: float = 30,
+                 tt_mb: Optional[float] = 16.0, tablebase: Union[str, Tablebase, None] = None,
+                 tt_simetria: bool = True, avaliacao_lote: bool = False, workers: int = 1,
+                 paralelo: str = "raiz", verbose: bool = False,
+                 estatisticas: bool = False, contempt: float = 0.0,
+                 livro: Union[str, LivroAberturas, None] = None):
         self.profundidade_maxima = profundidade_maxima
         self.limite_tempo = limite_tempo  # segundos, o padrao de maximo de profundidade é 4 e tempo 30 seg, mas da pra aumentar pra testar mais
+        # tabela de transposicao com limite de memoria em MB, None ou 0 desliga
+        self.tt: Optional[TabelaTransposicao] = TabelaTransposicao(tt_mb) if tt_mb else None
+        self.tt_simetria = tt_simetria # chave canonica (ver _PECAS_SIMETRIA) pra posicoes simetricas dividirem a entrada
+        # avalia o ultimo ply em lote com numpy (AvaliacaoLote), precisa do numpy instalado
+        if avaliacao_lote and not numpy_disponivel():
+            raise ImportError("avaliacao_lote precisa do numpy (pip install numpy)")
+        self.avaliacao_lote = avaliacao_lote
+        # tablebase gerada pelo Tablebase.py (caminho do arquivo ou ja aberta), posicao que esta nela nao precisa de busca
+        self.tablebase: Optional[Tablebase] = Tablebase(tablebase) if isinstance(tablebase, str) else tablebase
+        # livro de aberturas gerado pelo LivroAberturas.py, so é lido na primeira consulta
+        # e so é usado se foi gerado com busca pelo menos tao funda quanto a desta IA
+        self.livro: Optional[LivroAberturas] = LivroAberturas(livro) if isinstance(livro, str) else livro
+        # busca paralela com workers > 1, dois modos:
+        #   "raiz": os movimentos da raiz sao divididos num pool de processos
+        #   "smp": lazy smp, os workers buscam a mesma raiz com ordenacao um pouco diferente e dividem
+        #          uma tabela de transposicao em memoria compartilhada (TransposicaoCompartilhada)
+        if paralelo not in ("raiz", "smp"):
+            raise ValueError(f"Modo paralelo invalido: {paralelo}")
+        self.workers = max(1, workers)
+        self.paralelo = paralelo
+        if self.workers > 1 and paralelo == "smp" and tt_mb:
+            self.tt = TabelaCompartilhada(tt_mb)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._valores_raiz = None
+        self._parar = None
+        # qualquer coisa com .value: com valor != 0 a busca para como se o tempo tivesse acabado
+        # usado pelos ajudantes do smp (o processo principal manda parar) e pela ponderacao da interface web
+        self._sinal_parada = None
+        self._variacao: Optional[random.Random] = None # idem, sorteia a ordem dos empates na ordenacao
+        self._config = dict( # pra recriar a mesma IA dentro dos workers
+            profundidade_maxima=profundidade_maxima, limite_tempo=limite_tempo,
+            tt_mb=tt_mb, tablebase=self.tablebase.caminho if self.tablebase is not None else None,
+            tt_simetria=tt_simetria, avaliacao_lote=avaliacao_lote, contempt=contempt,
+        )
+        self.verbose = verbose # imprime o resumo de cada jogada
+        self.estatisticas = estatisticas # conta folhas e cortes por indice (EstatisticasBusca), custa um pouco em cada no
+        self._est: Optional[EstatisticasBusca] = None
+        # posicao repetida no caminho da busca (ou na partida) vale empate, do ponto de vista do max é -contempt
+        # contempt > 0 faz a IA evitar empate por repeticao, < 0 faz ela buscar
+        self.contempt = contempt
+        self._historico: frozenset = frozenset() # chave_repeticao das posicoes que ja aconteceram na partida
+        self._caminho: set = set()
+        # ordenacao dinamica: 2 killers por ply (movimentos que cortaram naquele ply) e a tabela de historia
+        # por jogador, indexada pelo _indice_movimento e somando profundidade^2 a cada corte beta
+        self._killers: List[List[int]] = []
+        self._historia: Dict[Jogador, List[int]] = {}
+        self.ultima_busca: Optional[EstatisticasBusca] = None
+        # variante principal da ultima busca completa, o segundo lance é a resposta que a IA espera do oponente
+        self.variante_principal: List[Peca.Move] = []
         self.nos_avaliados = 0
         self._t0 = 0.0 # pro controle do tempo
+        self._chave_max = 0
+        self.profundidade_alcancada = 0 # ultima iteracao completa do aprofundamento iterativo
+        self._prof_iter = 0
+        self._pv: List[List[Peca.Move]] = []          # variante principal por ply da iteracao atual
+        self._pv_anterior: List[Peca.Move] = []       # variante principal da iteracao anterior
+        self._seguindo_pv = False
+
+    def fechar(self) -> None: # encerra o pool de processos da busca paralela e a tabela compartilhada, se tiver
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+        if isinstance(self.tt, TabelaCompartilhada):
+            self.tt.fechar()
+            self.tt = None
+
+    def _obter_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._valores_raiz = multiprocessing.RawArray("d", _MAX_MOVIMENTOS_RAIZ)
+            self._parar = multiprocessing.RawValue("b", 0)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_iniciar_worker,
+                                             initargs=(self._valores_raiz, self._parar))
+        return self._pool
+
+    def _preparar_busca(self, jogador_max: Jogador, t0: float) -> None:
+        if t0 != self._t0: # busca nova (os workers da busca na raiz chamam isso a cada tarefa com o mesmo t0)
+            if self.tt is not None:
+                self.tt.nova_busca()
+            self._killers = [[-1, -1] for _ in range(_PROFUNDIDADE_SEM_LIMITE + 2)]
+            self._historia = {j: [0] * _NUM_INDICES_MOVIMENTO for j in Jogador}
+        self._t0 = t0
+        self._chave_max = _ZOBRIST_MAX[jogador_max]
+        self.nos_avaliados = 0
+
+    # lance do oponente que a ultima busca espera depois do movimento dela, None se a variante nao chegou la
+    def resposta_esperada(self) -> Optional[Peca.Move]:
+        return self.variante_principal[1] if len(self.variante_principal) > 1 else None
+
+    def estatisticas_tt(self) -> Optional[Dict[str, Any]]: # taxas de acerto e corte acumuladas, pra dimensionar a tabela
+        return self.tt.estatisticas() if self.tt is not None else None
 
     def _oponente(self, j: Jogador) -> Jogador: # só pra mudar o jogador mais facil, jogador_atual = self._oponente(jogador_atual) dai troca
         return Jogador.IA if j == Jogador.JOGADOR else Jogador.JOGADOR
@@ -29,6 +204,8 @@ class IA_Minimax:
     def _checar_tempo(self):
         if self.limite_tempo is not None and (time.time() - self._t0) >= self.limite_tempo:
             raise TimeoutError
+        if self._sinal_parada is not None and self._sinal_parada.value:
+            raise TimeoutError
 
     # nessa funcao usamos ajuda de ia pra sugerir uma logica simples pra heuristica
     #é pra ser parecido com o jogo da velha, o centro acaba sendo a parte mais importante
@@ -41,17 +218,15 @@ class IA_Minimax:
         if vencedor is not None:
             return -tab.WIN_SCORE
 
-        score = 0.0
-        for linha in WIN_LINES:
-            tops = [tab.top(pos) for pos in linha]
-            donos = [p.jogador if p else None for p in tops]
-            c_max = sum(1 for d in donos if d == max_player)
-            c_min = sum(1 for d in donos if (d is not None and d != max_player))
-
-            if   c_max == 2 and c_min == 0: score += tab.W_TWO_ALIGNED
-            elif c_max == 1 and c_min == 0: score += tab.W_ONE_ALIGNED
-            elif c_min == 2 and c_max == 0: score -= tab.W_BLOCK_THREAT
-            elif c_min == 1 and c_max == 0: score -= tab.W_ONE_ALIGNED
+        # o tabuleiro ja mantem quantas linhas tem cada combinacao de (casas do jogador, casas da IA)
+        # entao cada termo é uma leitura so: hist[c1*4 + c2]
+        hist = tab.hist_linhas
+        if max_player == Jogador.JOGADOR:
+            dois_max, um_max, dois_min, um_min = hist[2 * 4 + 0], hist[1 * 4 + 0], hist[0 * 4 + 2], hist[0 * 4 + 1]
+        else:
+            dois_max, um_max, dois_min, um_min = hist[0 * 4 + 2], hist[0 * 4 + 1], hist[2 * 4 + 0], hist[1 * 4 + 0]
+        score = (tab.W_TWO_ALIGNED * dois_max + tab.W_ONE_ALIGNED * um_max
+                 - tab.W_BLOCK_THREAT * dois_min - tab.W_ONE_ALIGNED * um_min)
 
         centro = tab.top(Pos(1, 1))
         if centro and centro.jogador == max_player:
@@ -59,14 +234,46 @@ class IA_Minimax:
 
         return score
 
-    def obter_melhor_movimento(self, tabuleiro: Tabuleiro, jogador: Jogador) -> Optional[Peca.Move]:
-        self.nos_avaliados = 0
-        self._t0 = time.time()
-        inicio = self._t0
+    def obter_melhor_movimento(self, tabuleiro: Tabuleiro, jogador: Jogador, historico=None) -> Optional[Peca.Move]:
+        return self.buscar(tabuleiro, jogador, historico)[0]
+
+    # mesmo que obter_melhor_movimento, mas devolve junto as estatisticas da busca
+    # historico: chave_repeticao das posicoes anteriores da partida, voltar pra uma delas conta como empate
+    def buscar(self, tabuleiro: Tabuleiro, jogador: Jogador, historico=None) -> Tuple[Optional[Peca.Move], EstatisticasBusca]:
+        inicio = time.time()
+        self._historico = frozenset(historico) if historico else frozenset()
+        est = EstatisticasBusca()
+        self.ultima_busca = est
+        self.variante_principal = []
+
+        if self.livro is not None: # antes de tudo, a jogada do livro nao precisa nem da copia do tabuleiro
+            r = self._movimento_livro(tabuleiro, jogador)
+            if r is not None:
+                self.nos_avaliados = 0
+                est.origem = "livro"
+                est.score = r[1]
+                est.tempo = time.time() - inicio
+                if self.verbose:
+                    print(est.resumo())
+                return r[0], est
+
+        self._preparar_busca(jogador, inicio)
+
+        # a busca faz e desfaz os movimentos num tabuleiro so, entao trabalha numa copia pra nao mexer no do jogo
+        tabuleiro = tabuleiro.clone()
 
         movimentos = tabuleiro.movimentos_possiveis(jogador)
         if not movimentos:
-            return None
+            return None, est
+
+        if self.tablebase is not None:
+            mv_tb = self._movimento_tablebase(tabuleiro, jogador, movimentos)
+            if mv_tb is not None:
+                est.origem = "tablebase"
+                est.tempo = time.time() - inicio
+                if self.verbose:
+                    print(est.resumo())
+                return mv_tb, est
 
        # ordenacao simples pra ajudar na poda depois
         def chave(mv: Peca.Move) -> int:
@@ -81,85 +288,423 @@ class IA_Minimax:
         movimentos.sort(key=chave)
 
         melhor_val = -math.inf
-        melhor_mov: Optional[Peca.Move] = movimentos[0] # se der timeout, pelo menos joga o primeiro na ordenacao, failsafe
-
-        try:
-            val, move = self._minimax(
-                tabuleiro,
-                jogador_max=jogador,
-                profundidade=self.profundidade_maxima,
-                alfa=-math.inf,
-                beta=math.inf,
-                maximizando=True,
-                jogador_atual=jogador
-            )
+        melhor_mov: Optional[Peca.Move] = movimentos[0] # se der timeout ja na profundidade 1, joga o primeiro na ordenacao, failsafe
+
+        # aprofundamento iterativo: busca com profundidade 1, 2, ... ate a maxima (ou ate o tempo acabar se nao tiver maxima)
+        # cada iteracao completa atualiza o melhor movimento, entao o timeout so perde a iteracao que estava rodando
+        # e a variante principal da iteracao anterior vai primeiro na ordenacao da proxima
+        prof_max = self.profundidade_maxima if self.profundidade_maxima is not None else _PROFUNDIDADE_SEM_LIMITE
+        self._pv_anterior = []
+        scores: List[float] = [] # score de cada iteracao completa, pra janela de aspiracao
+        self.profundidade_alcancada = 0
+        self._est = est if self.estatisticas else None
+        ajudantes = self._iniciar_ajudantes(tabuleiro, jogador) if self.workers > 1 and self.paralelo == "smp" else []
+        for prof in range(1, prof_max + 1):
+            t_iter = time.time()
+            nos_antes = self.nos_avaliados
+            self._prof_iter = prof
+            self._pv = [[] for _ in range(prof + 1)]
+            self._seguindo_pv = True
+            self._caminho = set(self._historico)
+            self._caminho.add(chave_repeticao(tabuleiro.codigo, jogador))
+            try:
+                if self.workers > 1 and self.paralelo == "raiz":
+                    val, move = self._raiz_paralela(tabuleiro, jogador, prof, movimentos)
+                else:
+                    val, move = self._raiz_aspiracao(tabuleiro, jogador, prof, scores[-2] if len(scores) >= 2 else None)
+            except TimeoutError:
+                # se der timeout, fica com o melhor movimento da ultima iteracao completa
+                est.timeout = True
+                break
             if move is not None: #só atualiza se achar algo melhor
                 melhor_val, melhor_mov = val, move
-        except TimeoutError:
-            # se der timeout, retorna o melhor movimento encontrado até agora
-            pass
+            scores.append(val)
+            est.nos_por_profundidade.append(self.nos_avaliados - nos_antes)
+            est.tempo_por_profundidade.append(time.time() - t_iter)
+            self.profundidade_alcancada = prof
+            self._pv_anterior = self._pv[0] if self._pv[0] and self._pv[0][0] == move else [move]
+            if abs(val) >= tabuleiro.WIN_SCORE: # vitoria ou derrota forcada, buscar mais fundo nao muda
+                break
+        self._parar_ajudantes(ajudantes)
+        if self.profundidade_alcancada:
+            self.variante_principal = list(self._pv_anterior)
+
+        est.nos = self.nos_avaliados
+        est.tempo = time.time() - inicio
+        est.profundidade = self.profundidade_alcancada
+        est.score = melhor_val if melhor_val != -math.inf else None
+        niveis = est.nos_por_profundidade
+        if len(niveis) >= 2 and niveis[-2]:
+            est.fator_ramificacao = niveis[-1] / niveis[-2]
+        elif niveis:
+            est.fator_ramificacao = float(niveis[0])
+        if self.tt is not None:
+            est.tt = self.tt.estatisticas()
+        if est.cortes_por_indice:
+            est.taxa_corte_primeiro = est.cortes_por_indice[0] / sum(est.cortes_por_indice)
+        self._est = None
+        if self.verbose:
+            print(est.resumo())
+        return melhor_mov, est
+
+    # janela de aspiracao: busca primeiro so em volta de um score esperado, se o valor sair da janela aquele lado abre
+    # e busca de novo. o esperado é o de duas iteracoes atras e nao o da anterior: a heuristica oscila bastante entre
+    # profundidade par e impar (quem fez o ultimo lance muda), mas fica perto entre duas da mesma paridade
+    def _raiz_aspiracao(self, tab: Tabuleiro, jogador: Jogador, profundidade: int, anterior: Optional[float]) -> tuple[float, Optional[Peca.Move]]:
+        alfa, beta = -math.inf, math.inf
+        if anterior is not None and abs(anterior) < tab.WIN_SCORE:
+            alfa, beta = anterior - _JANELA_ASPIRACAO, anterior + _JANELA_ASPIRACAO
+        while True:
+            self._seguindo_pv = True
+            val, move = self._negamax(tab, jogador, profundidade, alfa, beta, jogador)
+            if val <= alfa:
+                alfa = -math.inf
+            elif val >= beta:
+                beta = math.inf
+            else:
+                return val, move
+
+    # uma iteracao com os movimentos da raiz divididos entre os processos do pool, um movimento por tarefa
+    # cada tarefa busca com alfa = melhor valor ja terminado entre os movimentos ANTERIORES na ordem,
+    # lido de um array compartilhado na hora que ela comeca. so os anteriores pra escolha ficar igual a
+    # da busca serial: la um movimento so ganha se for estritamente melhor que os de antes dele
+    def _raiz_paralela(self, tab: Tabuleiro, jogador: Jogador, profundidade: int, movimentos: List[Peca.Move]) -> tuple[float, Optional[Peca.Move]]:
+        pool = self._obter_pool()
+        ordem = list(movimentos[:_MAX_MOVIMENTOS_RAIZ])
+        if self._pv_anterior and self._pv_anterior[0] in ordem: # melhor da iteracao anterior primeiro, como na serial
+            ordem.remove(self._pv_anterior[0])
+            ordem.insert(0, self._pv_anterior[0])
+        for i in range(len(ordem)):
+            self._valores_raiz[i] = math.nan
+
+        futuros = [
+            pool.submit(_buscar_movimento_raiz, self._config, tab, jogador, i, mv, profundidade, self._t0, self._historico)
+            for i, mv in enumerate(ordem)
+        ]
+        melhor = -math.inf
+        melhor_mov: Optional[Peca.Move] = None
+        acabou_tempo = False
+        for futuro in futuros: # na ordem dos movimentos, com o mesmo criterio da serial
+            if futuro.cancelled(): # cancelado depois que outro estourou o tempo, a iteracao ja esta perdida
+                continue
+            i, val, nos = futuro.result()
+            self.nos_avaliados += nos
+            if val is None:
+                acabou_tempo = True
+                for f in futuros:
+                    f.cancel()
+                continue
+            if val > melhor:
+                melhor, melhor_mov = val, ordem[i]
+        if acabou_tempo:
+            raise TimeoutError
+        return melhor, melhor_mov
+
+    # lazy smp: o processo principal faz a busca normal e os workers-1 ajudantes buscam a mesma raiz ao mesmo tempo,
+    # so pra encher a tabela compartilhada. metade deles vai um ply a frente e todos sorteiam a ordem dos empates,
+    # assim nao repetem exatamente o trabalho do principal. quando o principal termina os ajudantes param
+    def _iniciar_ajudantes(self, tab: Tabuleiro, jogador: Jogador) -> list:
+        pool = self._obter_pool()
+        self._parar.value = 0
+        nome_tt = self.tt.nome if self.tt is not None else None
+        geracao = self.tt.geracao if self.tt is not None else 0
+        # o pool serializa os argumentos numa thread depois do submit, e o principal ja esta mexendo no tab a essa altura:
+        # sem a copia um ajudante podia receber o tabuleiro no meio de um lance
+        return [pool.submit(_buscar_ajudante, self._config, nome_tt, tab.clone(), jogador, self._t0, geracao, i, self._historico)
+                for i in range(1, self.workers)]
+
+    def _parar_ajudantes(self, ajudantes: list) -> None:
+        if not ajudantes:
+            return
+        self._parar.value = 1
+        for futuro in ajudantes:
+            self.nos_avaliados += futuro.result()
 
-        tempo_decorrido = time.time() - inicio
-        print(f"Avaliados {self.nos_avaliados} nós em {tempo_decorrido:.2f}s (prof={self.profundidade_maxima})")
+    # movimento do livro, se a posicao esta nele. fica de fora se o livro é mais raso que a busca
+    # ou se o movimento volta pra uma posicao que ja aconteceu na partida (o livro nao sabe do historico)
+    def _movimento_livro(self, tab: Tabuleiro, jogador: Jogador) -> Optional[Tuple[Peca.Move, float]]:
+        if self.profundidade_maxima is not None and self.livro.profundidade < self.profundidade_maxima:
+            return None
+        r = self.livro.consultar(tab.codigo, jogador)
+        if r is None or r[0] not in tab.movimentos_possiveis(jogador):
+            return None
+        if chave_repeticao(tab.codigo_apos(jogador, r[0]), self._oponente(jogador)) in self._historico:
+            return None
+        return r
+
+    # se a raiz esta na tablebase escolhe direto: ganhando, a vitoria mais curta, empatando, um empate
+    # e perdendo, a derrota mais longa. cada filho é uma sondagem O(1) no arquivo
+    def _movimento_tablebase(self, tab: Tabuleiro, jogador: Jogador, movimentos: List[Peca.Move]) -> Optional[Peca.Move]:
+        raiz = self.tablebase.sondar(tab.codigo, jogador)
+        if raiz is None:
+            return None
+        oponente = self._oponente(jogador)
+        melhor_mov = None
+        melhor_chave = None
+        for mv in movimentos:
+            desfazer = tab.aplicar_movimento(jogador, mv)
+            r = self.tablebase.sondar(tab.codigo, oponente)
+            tab.desfazer_movimento(desfazer)
+            if r is None:
+                continue
+            res, dist = r
+            if res == DERROTA:   # derrota do oponente = vitoria nossa
+                chave = (0, dist)
+            elif res == EMPATE:
+                chave = (1, 0)
+            else:
+                chave = (2, -dist)
+            if melhor_chave is None or chave < melhor_chave:
+                melhor_chave, melhor_mov = chave, mv
         return melhor_mov
 
-    def _minimax(self,tab: Tabuleiro,jogador_max: Jogador,profundidade: int,alfa: float,beta: float,maximizando: bool,jogador_atual: Jogador) -> tuple[float, Optional[Peca.Move]]:
+    # negamax: o valor devolvido é sempre do ponto de vista de quem joga no no (jogador_atual),
+    # entao o filho volta com o sinal trocado e os dois lados usam o mesmo laco
+    # com pvs: o primeiro movimento (o da tt/pv, o mais provavel de ser o melhor) é buscado com a janela inteira
+    # e os outros com janela nula so pra provar que nao passam do alfa. se algum passar, busca de novo com a janela inteira
+    # a busca é fail-soft, o valor pode sair fora da janela e ai é um limite (como antes)
+    def _negamax(self, tab: Tabuleiro, jogador_max: Jogador, profundidade: int, alfa: float, beta: float, jogador_atual: Jogador) -> tuple[float, Optional[Peca.Move]]:
         self._checar_tempo()
         self.nos_avaliados += 1
+        ply = self._prof_iter - profundidade
+        self._pv[ply] = []
+        sinal = 1 if jogador_atual == jogador_max else -1 # a heuristica é do max, o min enxerga ela com sinal trocado
 
         vencedor = tab.ganhador()
         if vencedor is not None or profundidade == 0:
-            return self._avaliar(tab, jogador_max), None
+            if self._est is not None:
+                self._est.avaliacoes_folha += 1
+            return sinal * self._avaliar(tab, jogador_max), None
+
+        # voltou pra uma posicao do caminho: daqui o melhor pros dois é repetir de novo, entao é empate
+        # e a subarvore inteira do ciclo nao precisa ser buscada
+        chave_rep = chave_repeticao(tab.codigo, jogador_atual)
+        if ply and chave_rep in self._caminho:
+            return -sinal * self.contempt, None
+
+        if self.tablebase is not None: # posicao resolvida, o valor é exato
+            r = self.tablebase.sondar(tab.codigo, jogador_atual)
+            if r is not None:
+                if r[0] == EMPATE:
+                    return 0.0, None
+                return (tab.WIN_SCORE if r[0] == VITORIA else -tab.WIN_SCORE), None
+
+        # consulta a tabela de transposicao, se ja buscou essa posicao com profundidade suficiente usa o resultado
+        # o score guardado é o do negamax (de quem joga), a chave ja leva a vez e quem é o max
+        tt = self.tt
+        mv_tt: Optional[Peca.Move] = None
+        if tt is not None:
+            sim_tt = 0 # transformacao pra forma canonica, o movimento guardado fica nessa forma
+            if self.tt_simetria and tab.codigo.bit_count() <= _PECAS_SIMETRIA:
+                canonico, sim_tt = canonizar_codigo(tab.codigo)
+                chave_tt = ((canonico * _MULT_CHAVE) & _M64) ^ ZOBRIST_VEZ[jogador_atual] ^ self._chave_max
+            else:
+                chave_tt = tab.hash ^ ZOBRIST_VEZ[jogador_atual] ^ self._chave_max
+            entrada = tt.sondar(chave_tt)
+            if entrada is not None:
+                _, prof_tt, tipo_tt, score_tt, mv_tt, _ = entrada
+                if sim_tt and mv_tt is not None:
+                    mv_tt = destransformar_movimento(mv_tt, sim_tt)
+                if prof_tt >= profundidade and (
+                    tipo_tt == EXATO
+                    or (tipo_tt == INFERIOR and score_tt >= beta)
+                    or (tipo_tt == SUPERIOR and score_tt <= alfa)
+                ):
+                    tt.registrar_corte()
+                    return score_tt, mv_tt
+            alfa_orig, beta_orig = alfa, beta
 
         movimentos = tab.movimentos_possiveis(jogador_atual)
         if not movimentos:
-            return self._avaliar(tab, jogador_max), None
+            if self._est is not None:
+                self._est.avaliacoes_folha += 1
+            return sinal * self._avaliar(tab, jogador_max), None
 
-        # ordenacao pra melhorar a poda
-        def chave(mv: Peca.Move) -> int:
-            pri = 0
-            if mv.dst == Pos(1, 1): pri += 3
-            if mv.tipo == "place":
-                pri += 2
-                pri += (mv.size or Tamanho.P)
+        self._ordenar(tab, movimentos, jogador_atual, ply)
+        if mv_tt is not None and mv_tt in movimentos: # melhor movimento da tabela vai primeiro
+            movimentos.remove(mv_tt)
+            movimentos.insert(0, mv_tt)
+
+        # enquanto estiver descendo pela variante principal da iteracao anterior, o movimento dela vai na frente de tudo
+        if self._seguindo_pv:
+            if ply < len(self._pv_anterior) and self._pv_anterior[ply] in movimentos:
+                mv_pv = self._pv_anterior[ply]
+                movimentos.remove(mv_pv)
+                movimentos.insert(0, mv_pv)
             else:
-                pri += 1
-            return -pri
-        movimentos.sort(key=chave)
+                self._seguindo_pv = False
 
         melhor_mov: Optional[Peca.Move] = None
 
-        if maximizando:
-            melhor = -math.inf
-            for mv in movimentos:
+        self._caminho.add(chave_rep)
+        oponente = self._oponente(jogador_atual)
+        melhor = -math.inf
+        # no modo em lote, no ultimo ply o primeiro filho desce normal e, se ele nao cortou, os outros sao avaliados
+        # de uma vez com numpy e o laco so le os valores, com a mesma logica de poda. quase todo corte de no de
+        # corte sai no primeiro filho, entao o lote so roda onde o laco ia avaliar os filhos todos mesmo
+        # (os filhos sao folhas, e folha nao olha repeticao nem tablebase tambem no caminho normal)
+        valores: Optional[List[float]] = None
+        lote = profundidade == 1 and self.avaliacao_lote and len(movimentos) > _MIN_LOTE
+        for i, mv in enumerate(movimentos):
+            if i == 1 and lote:
                 self._checar_tempo()
-                filho = tab.clone()
-                filho.aplicar_movimento(jogador_atual, mv)
-                val, _ = self._minimax(
-                    filho, jogador_max, profundidade - 1, alfa, beta,
-                    False, self._oponente(jogador_atual)
-                )
-                if val > melhor:
-                    melhor = val
-                    melhor_mov = mv
-                alfa = max(alfa, melhor)
-                if beta <= alfa:
-                    break
-            return melhor, melhor_mov
-        else:
-            pior = math.inf
-            for mv in movimentos:
+                valores = avaliar_lote([tab.codigo_apos(jogador_atual, m) for m in movimentos[1:]], jogador_max).tolist()
+                self.nos_avaliados += len(valores)
+                if self._est is not None:
+                    self._est.avaliacoes_folha += len(valores)
+            if valores is not None:
+                val = sinal * valores[i - 1]
+            else:
                 self._checar_tempo()
-                filho = tab.clone()
-                filho.aplicar_movimento(jogador_atual, mv)
-                val, _ = self._minimax(
-                    filho, jogador_max, profundidade - 1, alfa, beta,
-                    True, self._oponente(jogador_atual)
-                )
-                if val < pior:
-                    pior = val
-                    melhor_mov = mv
-                beta = min(beta, pior)
-                if beta <= alfa:
-                    break
-            return pior, melhor_mov
\ No newline at end of file
+                desfazer = tab.aplicar_movimento(jogador_atual, mv)
+                if i == 0 or beta - alfa <= _JANELA_NULA: # primeiro movimento, ou o no ja esta numa janela nula
+                    val = -self._negamax(tab, jogador_max, profundidade - 1, -beta, -alfa, oponente)[0]
+                else:
+                    val = -self._negamax(tab, jogador_max, profundidade - 1, -alfa - _JANELA_NULA, -alfa, oponente)[0]
+                    if alfa < val < beta: # passou do alfa, entao pode ser o melhor: precisa do valor exato
+                        val = -self._negamax(tab, jogador_max, profundidade - 1, -beta, -alfa, oponente)[0]
+                tab.desfazer_movimento(desfazer)
+            self._seguindo_pv = False
+            if val > melhor:
+                melhor = val
+                melhor_mov = mv
+                self._pv[ply] = [mv] + self._pv[ply + 1]
+            alfa = max(alfa, melhor)
+            if beta <= alfa:
+                self._registrar_corte(mv, i, ply, profundidade, jogador_atual)
+                break
+        self._caminho.discard(chave_rep)
+        if tt is not None:
+            self._gravar_tt(chave_tt, profundidade, melhor, alfa_orig, beta_orig, melhor_mov, sim_tt)
+        return melhor, melhor_mov
+
+    # ordem: vitoria (fecha linha), bloqueio (ocupa a casa que fecharia linha do adversario), killers do ply,
+    # historia, e no empate o criterio estatico (centro, place, peca maior). o movimento da tt e o da pv
+    # vao pra frente depois, no _negamax
+    def _ordenar(self, tab: Tabuleiro, movimentos: List[Peca.Move], jogador: Jogador, ply: int) -> None:
+        vis1, vis2 = visiveis_de(tab.codigo)
+        meu, dele = (vis1, vis2) if jogador == Jogador.JOGADOR else (vis2, vis1)
+        ameaca_meu = AMEACAS[meu]
+        ameaca_dele = AMEACAS[dele]
+        killer1, killer2 = self._killers[ply]
+        historia = self._historia[jogador]
+        rng = self._variacao
+
+        def chave(mv: Peca.Move):
+            d = mv.dst.linha * 3 + mv.dst.coluna
+            if mv.tipo == "place":
+                idx = (mv.size - 1) * 9 + d
+                ameaca = ameaca_meu
+                estatico = 2 + mv.size
+            else: # a peca sai da origem, entao a origem nao conta pra fechar a linha
+                o = mv.org.linha * 3 + mv.org.coluna
+                idx = 27 + o * 9 + d
+                ameaca = AMEACAS[meu & ~(1 << o)]
+                estatico = 1
+            if d == 4:
+                estatico += 3
+            if ameaca >> d & 1:
+                nivel = 0
+            elif ameaca_dele >> d & 1:
+                nivel = 1
+            elif idx == killer1:
+                nivel = 2
+            elif idx == killer2:
+                nivel = 3
+            else:
+                nivel = 4
+            if rng is not None: # ajudante do lazy smp, sorteia a ordem dos empates
+                return nivel, -historia[idx], -estatico, rng.random()
+            return nivel, -historia[idx], -estatico
+        movimentos.sort(key=chave)
+
+    def _registrar_corte(self, mv: Peca.Move, indice: int, ply: int, profundidade: int, jogador: Jogador) -> None:
+        idx = _indice_movimento(mv)
+        killers = self._killers[ply]
+        if killers[0] != idx:
+            killers[1] = killers[0]
+            killers[0] = idx
+        self._historia[jogador][idx] += profundidade * profundidade
+        if self._est is not None:
+            self._est.registrar_corte(indice)
+
+    def _gravar_tt(self, chave: int, profundidade: int, valor: float, alfa: float, beta: float, mv: Optional[Peca.Move], sim: int = 0) -> None:
+        # alfa e beta sao a janela com que o no comecou, define se o valor é exato ou so um limite
+        if valor <= alfa:
+            tipo = SUPERIOR
+        elif valor >= beta:
+            tipo = INFERIOR
+        else:
+            tipo = EXATO
+        if sim and mv is not None:
+            mv = transformar_movimento(mv, sim)
+        self.tt.gravar(chave, profundidade, tipo, valor, mv)
+
+
+# lado dos processos da busca paralela: cada worker guarda sua IA (e a tabela de transposicao dela) entre tarefas
+_valores_raiz_worker = None
+_parar_worker = None
+_ias_worker: Dict[tuple, IA_Minimax] = {}
+
+def _iniciar_worker(valores, parar) -> None:
+    global _valores_raiz_worker, _parar_worker
+    _valores_raiz_worker = valores
+    _parar_worker = parar
+
+def _ia_do_worker(config: Dict[str, Any], nome_tt: Optional[str] = None) -> IA_Minimax:
+    chave = (tuple(sorted(config.items())), nome_tt)
+    ia = _ias_worker.get(chave)
+    if ia is None:
+        if nome_tt is None:
+            ia = IA_Minimax(**config)
+        else: # ajudante do smp usa a tabela compartilhada no lugar da propria
+            ia = IA_Minimax(**{**config, "tt_mb": None})
+            ia.tt = TabelaCompartilhada(config["tt_mb"], nome=nome_tt)
+        _ias_worker[chave] = ia
+    return ia
+
+def _buscar_ajudante(config: Dict[str, Any], nome_tt: Optional[str], tab: Tabuleiro, jogador: Jogador,
+                     t0: float, geracao: int, indice: int, historico: frozenset = frozenset()) -> int:
+    ia = _ia_do_worker(config, nome_tt)
+    ia._sinal_parada = _parar_worker
+    ia._variacao = random.Random(indice)
+    ia._preparar_busca(jogador, t0)
+    if ia.tt is not None:
+        ia.tt.geracao = geracao
+    prof_max = ia.profundidade_maxima if ia.profundidade_maxima is not None else _PROFUNDIDADE_SEM_LIMITE
+    try:
+        for prof in range(1 + indice % 2, prof_max + 1 + indice % 2):
+            ia._prof_iter = prof
+            ia._pv = [[] for _ in range(prof + 1)]
+            ia._seguindo_pv = False
+            ia._caminho = set(historico)
+            ia._caminho.add(chave_repeticao(tab.codigo, jogador))
+            ia._negamax(tab, jogador, prof, -math.inf, math.inf, jogador)
+    except TimeoutError:
+        pass
+    return ia.nos_avaliados
+
+def _buscar_movimento_raiz(config: Dict[str, Any], tab: Tabuleiro, jogador: Jogador, indice: int,
+                           mv: Peca.Move, profundidade: int, t0: float,
+                           historico: frozenset = frozenset()) -> tuple[int, Optional[float], int]:
+    ia = _ia_do_worker(config)
+
+    alfa = -math.inf
+    for j in range(indice):
+        v = _valores_raiz_worker[j]
+        if not math.isnan(v) and v > alfa:
+            alfa = v
+
+    ia._preparar_busca(jogador, t0)
+    ia._prof_iter = profundidade
+    ia._pv = [[] for _ in range(profundidade + 1)]
+    ia._seguindo_pv = False
+    ia._caminho = set(historico)
+    ia._caminho.add(chave_repeticao(tab.codigo, jogador))
+    try:
+        tab.aplicar_movimento(jogador, mv)
+        val = -ia._negamax(tab, jogador, profundidade - 1, -math.inf, -alfa, ia._oponente(jogador))[0]
+    except TimeoutError:
+        return indice, None, ia.nos_avaliados
+    _valores_raiz_worker[indice] = val
+    return indice, val, ia.nos_avaliados
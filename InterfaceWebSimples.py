@@ -1,38 +1,215 @@
 import http.server
-import socketserver
+import gzip
+import zlib
+import hashlib
 import webbrowser
 import json
 import urllib.parse
-from typing import Optional, Dict, Any
+import uuid
+import secrets
+import functools
+import argparse
+import os
+from http.cookies import SimpleCookie
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple
 import threading
 import time
 
-from Tabuleiro import Tabuleiro, Jogador, Tamanho, Peca, Pos
-from IA import IA_Minimax
+from Tabuleiro import Tabuleiro, Jogador, Tamanho, Peca, Pos, REPETICOES_EMPATE, chave_repeticao
+from IA import IA_Minimax, EstatisticasBusca
+from Analise import analisar
 
 
-class JogoWeb:
+class _SinalParada: # a IA para a busca quando value != 0 (ver IA_Minimax._checar_tempo)
     def __init__(self):
+        self.value = 0
+
+
+def _sincronizado(metodo): # o servidor atende cada requisicao numa thread, o estado do jogo fica atras do lock
+    @functools.wraps(metodo)
+    def envolvido(self, *args, **kwargs):
+        with self._lock:
+            return metodo(self, *args, **kwargs)
+    return envolvido
+
+
+def _publica_estado(metodo): # igual ao _sincronizado, e no fim avisa quem espera em esperar_estado se o estado mudou
+    @functools.wraps(metodo)
+    def envolvido(self, *args, **kwargs):
+        with self._lock:
+            try:
+                return metodo(self, *args, **kwargs)
+            finally:
+                self._publicar()
+    return envolvido
+
+
+class JogoWeb:
+    MAX_JOBS = 16 # jobs terminados guardados pra consulta, os mais velhos saem primeiro
+    # memoria aproximada, medida com tracemalloc: a partida com a IA ja depois da primeira busca (sem a tabela)
+    # e o que cresce com ela. a tabela de transposicao conta pelo tamanho cheio, que é o limite dela
+    MEMORIA_BASE = 16 * 1024
+    MEMORIA_POR_POSICAO = 100  # cada posicao no historico
+    MEMORIA_POR_JOB = 2 * 1024 # job terminado, com o resultado e as estatisticas
+
+    # tt_mb: tabela de transposicao da IA desta partida, com varias partidas no mesmo processo é o que mais pesa
+    # vagas_ponder: semaforo dividido entre as partidas do processo, sem vaga livre a partida nao pondera
+    def __init__(self, ponderar: bool = True, tt_mb: Optional[float] = 16.0,
+                 vagas_ponder: Optional[threading.Semaphore] = None):
+        self._lock = threading.RLock()
+        self.tt_mb = tt_mb
         self.tabuleiro = Tabuleiro()
         self.jogador_humano = Jogador.JOGADOR
         self.jogador_ia = Jogador.IA
         self.jogador_atual = self.jogador_humano
-        self.ia = IA_Minimax(profundidade_maxima=4, limite_tempo=30.0)
+        self.ia = IA_Minimax(profundidade_maxima=4, limite_tempo=30.0, tt_mb=tt_mb, estatisticas=True)
         self.jogo_ativo = False
         self.posicao_origem = None
         self.mensagem_status = "Clique em 'Novo Jogo' para começar"
+        self.historico: Dict[int, int] = {} # contagem de cada posicao (com a vez), pra empate por repeticao
+        self.empate = False
+        # ponderacao: enquanto o humano pensa uma thread ja busca as posicoes depois das respostas dele
+        self.ponderar = ponderar
+        self._vagas_ponder = vagas_ponder
+        self._ponder: Optional[threading.Thread] = None
+        self._ponder_lock = threading.Lock()
+        self._ponder_parar = _SinalParada()
+        self._ponder_atual: Optional[int] = None # chave_repeticao da posicao que a thread esta buscando agora
+        self._ponder_so_esta = False # o humano jogou a posicao que esta sendo buscada, termina ela e para
+        self._ponder_resultados: Dict[int, Tuple[Optional[Peca.Move], EstatisticasBusca]] = {}
+        # a busca da IA roda fora do lock: _partida muda a cada novo jogo, e uma busca de uma partida velha é descartada
+        self._partida = 0
+        self._ia_pensando = False
+        self._parar_ia = _SinalParada()
+        # movimento da IA em segundo plano: /api/movimento_ia cria um job e devolve o id na hora
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._job_atual: Optional[str] = None
+        # eventos (/api/eventos): o estado em json so é refeito quando alguma acao pode ter mudado ele,
+        # e se mudou a versao sobe e acorda quem esta esperando. cliente parado nao custa nada
+        self._mudou = threading.Condition(self._lock)
+        self._versao = 0
+        self._estado_json: Optional[str] = None
+        self.fechado = False
+        with self._lock:
+            self._publicar()
         
+    @_publica_estado
     def novo_jogo(self, quem_comeca: str = "jogador", profundidade: int = 4, tempo_limite: float = 30.0):
         # limitamos a profundidade pra 6
         profundidade = min(max(profundidade, 1), 6)
         
         self.tabuleiro = Tabuleiro()
         self.jogador_atual = self.jogador_ia if quem_comeca == "ia" else self.jogador_humano
-        self.ia = IA_Minimax(profundidade_maxima=profundidade, limite_tempo=tempo_limite)
+        self._encerrar_ponder()
+        self._parar_ia.value = 1 # se a IA estava pensando na partida velha, para
+        self._partida += 1
+        self._ia_pensando = False
+        self._job_atual = None
+        self.ia.fechar() # a IA velha pode ter um pool de processos aberto
+        self.ia = IA_Minimax(profundidade_maxima=profundidade, limite_tempo=tempo_limite, tt_mb=self.tt_mb, estatisticas=True)
         self.jogo_ativo = True
         self.posicao_origem = None
+        self.historico = {}
+        self.empate = False
+        self._registrar_posicao()
         self.mensagem_status = "Sua vez!" if self.jogador_atual == self.jogador_humano else "IA está pensando..."
         
+    def _registrar_posicao(self) -> bool: # conta a posicao atual, se deu empate por repeticao ja encerra o jogo
+        chave = chave_repeticao(self.tabuleiro.codigo, self.jogador_atual)
+        self.historico[chave] = self.historico.get(chave, 0) + 1
+        if self.historico[chave] >= REPETICOES_EMPATE:
+            self.jogo_ativo = False
+            self.empate = True
+            self.mensagem_status = "🤝 Empate por repetição!"
+            self._encerrar_ponder() # a busca da posicao jogada pode ter ficado rodando, ninguem mais vai usar
+        return self.empate
+
+    # bytes que esta partida pode ocupar, pro SessoesJogo limitar a memoria do processo
+    def memoria_estimada(self) -> int:
+        tt = self.ia.tt
+        memoria_tt = tt.num_entradas * (8 + tt.BYTES_POR_ENTRADA) if tt is not None else 0 # lista + entradas
+        return (self.MEMORIA_BASE + memoria_tt + len(self.historico) * self.MEMORIA_POR_POSICAO
+                + len(self._jobs) * self.MEMORIA_POR_JOB)
+
+    @_publica_estado
+    def fechar(self): # partida saiu da memoria: para a ponderacao e a busca que estiver rodando
+        self.fechado = True
+        self._encerrar_ponder()
+        self._parar_ia.value = 1
+        self._partida += 1
+        self.ia.fechar()
+
+    # depois do lance da IA busca cada resposta possivel do humano, a que a IA espera (variante principal) primeiro.
+    # as buscas completas ficam guardadas pela posicao, e mesmo as outras deixam a tabela de transposicao da IA quente
+    def _iniciar_ponder(self):
+        if not self.ponderar or not self.jogo_ativo:
+            return
+        # a busca é cpu pura e divide o gil com o servidor, entao nao espera vaga: sem vaga so nao pondera desta vez
+        if self._vagas_ponder is not None and not self._vagas_ponder.acquire(blocking=False):
+            return
+        respostas = self.tabuleiro.movimentos_possiveis(self.jogador_humano)
+        esperada = self.ia.resposta_esperada()
+        if esperada in respostas:
+            respostas.remove(esperada)
+            respostas.insert(0, esperada)
+        self._ponder_parar.value = 0
+        self._ponder_so_esta = False
+        self._ponder_resultados = {}
+        self._ponder = threading.Thread(target=self._ponderar, daemon=True,
+                                        args=(self.tabuleiro.clone(), respostas, set(self.historico)))
+        self._ponder.start()
+
+    def _ponderar(self, tab: Tabuleiro, respostas: List[Peca.Move], historico: set):
+        self.ia._sinal_parada = self._ponder_parar
+        try:
+            for mv in respostas:
+                filho = tab.clone()
+                filho.aplicar_movimento(self.jogador_humano, mv)
+                if filho.acabou():
+                    continue
+                chave = chave_repeticao(filho.codigo, self.jogador_ia)
+                with self._ponder_lock:
+                    if self._ponder_parar.value or self._ponder_so_esta:
+                        break
+                    self._ponder_atual = chave
+                movimento, est = self.ia.buscar(filho, self.jogador_ia, historico | {chave})
+                with self._ponder_lock:
+                    # timeout pelo limite de tempo vale como uma busca normal, parada pelo sinal nao
+                    if not self._ponder_parar.value:
+                        self._ponder_resultados[chave] = (movimento, est)
+                    self._ponder_atual = None
+        finally:
+            self.ia._sinal_parada = None
+            if self._vagas_ponder is not None:
+                self._vagas_ponder.release()
+
+    # o humano jogou (chave = posicao nova com a vez da IA) ou o jogo recomecou (None).
+    # se a thread esta buscando justo essa posicao deixa terminar, o fazer_movimento_ia espera. senao para tudo
+    def _encerrar_ponder(self, chave: Optional[int] = None):
+        if self._ponder is None:
+            return
+        with self._ponder_lock:
+            acerto = chave is not None and chave == self._ponder_atual
+            if acerto:
+                self._ponder_so_esta = True
+            else:
+                self._ponder_parar.value = 1
+        if not acerto:
+            self._ponder.join()
+            self._ponder = None
+
+    def _resultado_ponder(self, chave: int) -> Optional[Tuple[Optional[Peca.Move], EstatisticasBusca]]:
+        ponder = self._ponder
+        if ponder is not None: # so sobra thread rodando se ela esta buscando a posicao atual
+            ponder.join()
+            self._ponder = None
+        resultado = self._ponder_resultados.get(chave)
+        self._ponder_resultados = {}
+        return resultado
+
+    @_sincronizado
     def obter_estado(self) -> Dict[str, Any]:
         grid = []
         for i in range(3):
@@ -49,24 +226,44 @@ class JogoWeb:
                 else:
                     linha.append(None)
             grid.append(linha)
-            
+
+        vencedor = self.tabuleiro.ganhador()
         return {
             'grid': grid,
             'jogador_atual': int(self.jogador_atual),
             'jogo_ativo': self.jogo_ativo,
             'estoque_jogador': {int(k): v for k, v in self.tabuleiro.stock[self.jogador_humano].items()},
             'estoque_ia': {int(k): v for k, v in self.tabuleiro.stock[self.jogador_ia].items()},
-            'vencedor': int(self.tabuleiro.ganhador()) if self.tabuleiro.ganhador() else None,
+            'vencedor': int(vencedor) if vencedor else None,
+            'empate': self.empate,
             'posicao_origem': [self.posicao_origem.linha, self.posicao_origem.coluna] if self.posicao_origem else None,
             'mensagem_status': self.mensagem_status
         }
         
+    def _publicar(self): # chamado com o lock
+        estado = json.dumps(self.obter_estado())
+        if estado != self._estado_json or self.fechado:
+            self._estado_json = estado
+            self._versao += 1
+            self._mudou.notify_all()
+
+    # espera o estado passar da versao que o cliente ja tem, devolve (versao, estado em json)
+    # ou None se deu o timeout sem mudanca ou a partida foi fechada
+    def esperar_estado(self, versao: int, timeout: float) -> Optional[Tuple[int, str]]:
+        with self._mudou:
+            if self._versao == versao and not self.fechado:
+                self._mudou.wait(timeout)
+            if self._versao == versao or self.fechado:
+                return None
+            return self._versao, self._estado_json
+
     def _obter_simbolo_peca(self, peca: Peca) -> str:
         if peca.jogador == self.jogador_humano:
             return {Tamanho.P: "●", Tamanho.M: "⬤", Tamanho.G: "⚫"}[peca.tamanho]
         else:
             return {Tamanho.P: "○", Tamanho.M: "◯", Tamanho.G: "⭕"}[peca.tamanho]
         
+    @_publica_estado
     def fazer_movimento_humano(self, acao: str, linha: int, coluna: int, tamanho: Optional[int] = None):
         if not self.jogo_ativo or self.jogador_atual != self.jogador_humano:
             return {'sucesso': False, 'erro': 'Não é sua vez!'}
@@ -95,9 +292,12 @@ class JogoWeb:
                 self.tabuleiro.slide(self.posicao_origem, pos)
                 self.posicao_origem = None
                 
+            self._encerrar_ponder(chave_repeticao(self.tabuleiro.codigo, self.jogador_ia))
+
             # verifica fim de jogo
             if self.tabuleiro.acabou():
                 self.jogo_ativo = False
+                self._encerrar_ponder()
                 vencedor = self.tabuleiro.ganhador()
                 if vencedor == self.jogador_humano:
                     self.mensagem_status = "🎉 Você venceu!"
@@ -107,56 +307,274 @@ class JogoWeb:
                 
             # passa vez para IA
             self.jogador_atual = self.jogador_ia
+            if self._registrar_posicao():
+                return {'sucesso': True, 'fim_jogo': True, 'empate': True}
             self.mensagem_status = "IA está pensando..."
             return {'sucesso': True, 'vez_ia': True}
             
         except ValueError as e:
             return {'sucesso': False, 'erro': str(e)}
             
+    # a busca em si roda sem o lock, so a conferencia antes e a aplicacao do lance depois seguram o jogo
     def fazer_movimento_ia(self):
-        if not self.jogo_ativo or self.jogador_atual != self.jogador_ia:
-            return {'sucesso': False, 'erro': 'Não é vez da IA!'}
-            
+        with self._lock:
+            if not self.jogo_ativo or self.jogador_atual != self.jogador_ia or self._ia_pensando:
+                return {'sucesso': False, 'erro': 'Não é vez da IA!'}
+            self._ia_pensando = True
+            self._parar_ia = parar = _SinalParada()
+            partida, ia = self._partida, self.ia
+            tab, historico = self.tabuleiro.clone(), dict(self.historico)
+
         try:
-            movimento = self.ia.obter_melhor_movimento(self.tabuleiro, self.jogador_ia)
-            if movimento:
-                self.tabuleiro.aplicar_movimento(self.jogador_ia, movimento)
-                
-            # verifica fim de jogo
-            if self.tabuleiro.acabou():
-                self.jogo_ativo = False
-                vencedor = self.tabuleiro.ganhador()
-                if vencedor == self.jogador_humano:
-                    self.mensagem_status = "🎉 Você venceu!"
-                elif vencedor == self.jogador_ia:
-                    self.mensagem_status = "😅 A IA venceu!"
-                return {'sucesso': True, 'fim_jogo': True}
-                
-            # passa vez para jogador
-            self.jogador_atual = self.jogador_humano
-            self.mensagem_status = "Sua vez!"
-            return {'sucesso': True}
-            
+            resultado = self._resultado_ponder(chave_repeticao(tab.codigo, self.jogador_ia))
+            ponder = resultado is not None # lance ja calculado enquanto o humano pensava
+            if not ponder:
+                ia._sinal_parada = parar
+                try:
+                    resultado = ia.buscar(tab, self.jogador_ia, historico)
+                finally:
+                    ia._sinal_parada = None
+            movimento, est = resultado
+            estatisticas = est.como_dict()
         except Exception as e:
+            with self._lock:
+                if partida == self._partida:
+                    self._ia_pensando = False
             return {'sucesso': False, 'erro': f'Erro na IA: {str(e)}'}
+
+        return self._concluir_movimento_ia(partida, movimento, estatisticas, ponder)
+
+    @_publica_estado
+    def _concluir_movimento_ia(self, partida: int, movimento: Optional[Peca.Move], estatisticas: Dict[str, Any], ponder: bool):
+        if partida != self._partida:
+            return {'sucesso': False, 'erro': 'O jogo foi reiniciado durante a busca'}
+        self._ia_pensando = False
+        if movimento:
+            self.tabuleiro.aplicar_movimento(self.jogador_ia, movimento)
+            
+        # verifica fim de jogo
+        if self.tabuleiro.acabou():
+            self.jogo_ativo = False
+            self._encerrar_ponder()
+            vencedor = self.tabuleiro.ganhador()
+            if vencedor == self.jogador_humano:
+                self.mensagem_status = "🎉 Você venceu!"
+            elif vencedor == self.jogador_ia:
+                self.mensagem_status = "😅 A IA venceu!"
+            return {'sucesso': True, 'fim_jogo': True, 'estatisticas': estatisticas, 'ponder': ponder}
+            
+        # passa vez para jogador
+        self.jogador_atual = self.jogador_humano
+        if self._registrar_posicao():
+            return {'sucesso': True, 'fim_jogo': True, 'empate': True, 'estatisticas': estatisticas, 'ponder': ponder}
+        self.mensagem_status = "Sua vez!"
+        self._iniciar_ponder()
+        return {'sucesso': True, 'estatisticas': estatisticas, 'ponder': ponder}
+
+    # /api/movimento_ia: a busca vai pra uma thread e o id do job volta na hora, o cliente consulta com estado_job
+    # se ja tem um job rodando devolve o mesmo id, entao clicar duas vezes nao faz a IA jogar duas vezes
+    @_sincronizado
+    def iniciar_movimento_ia(self) -> Dict[str, Any]:
+        if self._job_atual is not None:
+            return {'sucesso': True, 'job': self._job_atual}
+        if not self.jogo_ativo or self.jogador_atual != self.jogador_ia or self._ia_pensando:
+            return {'sucesso': False, 'erro': 'Não é vez da IA!'}
+        job = {'job': uuid.uuid4().hex, 'status': 'rodando', 'resultado': None}
+        self._jobs[job['job']] = job
+        while len(self._jobs) > self.MAX_JOBS:
+            self._jobs.popitem(last=False)
+        self._job_atual = job['job']
+        threading.Thread(target=self._executar_job, args=(job,), daemon=True).start()
+        return {'sucesso': True, 'job': job['job']}
+
+    def _executar_job(self, job: Dict[str, Any]):
+        resultado = self.fazer_movimento_ia()
+        with self._lock:
+            job['resultado'] = resultado
+            job['status'] = 'pronto'
+            if self._job_atual == job['job']:
+                self._job_atual = None
+
+    @_sincronizado
+    def estado_job(self, job_id: str) -> Dict[str, Any]:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return {'sucesso': False, 'erro': 'Job não encontrado'}
+        return {'sucesso': True, **job}
+
+    @_publica_estado
+    def cancelar_origem(self):
+        self.posicao_origem = None
+        self.mensagem_status = "Sua vez!"
         
+class SessoesJogo:
+    # uma partida por sessao (cookie), num dicionario em ordem de uso: a menos usada fica na frente
+    # sai da memoria a sessao parada ha mais de tempo_ocioso segundos, e a menos usada quando passa de
+    # max_sessoes ou a soma das JogoWeb.memoria_estimada passa de memoria_mb
+    # ponderacao aqui é opcional: cada thread de ponder é uma busca inteira disputando o gil com todas as outras
+    # sessoes, entao alem de ligar, no maximo max_ponder partidas ponderam ao mesmo tempo
+    def __init__(self, max_sessoes: int = 1000, tempo_ocioso: float = 1800.0, memoria_mb: Optional[float] = 512.0,
+                 tt_mb: Optional[float] = 0.5, ponderar: bool = False, max_ponder: int = 1):
+        self.max_sessoes = max(1, max_sessoes)
+        self.tempo_ocioso = tempo_ocioso
+        self.memoria_mb = memoria_mb
+        self.tt_mb = tt_mb
+        self.ponderar = ponderar
+        self._vagas_ponder = threading.BoundedSemaphore(max(1, max_ponder))
+        self._lock = threading.Lock()
+        self._sessoes: "OrderedDict[str, Tuple[JogoWeb, float]]" = OrderedDict() # id -> (jogo, ultimo acesso)
+        self._memoria: Dict[str, int] = {} # memoria_estimada de cada sessao no ultimo acesso
+        self._memoria_total = 0
+        self.criadas = 0
+        self.despejadas = 0
+
+    # (id, jogo, se criou agora). id desconhecido (ou ja despejado) vira uma sessao nova com id novo,
+    # o cliente nunca escolhe o proprio id
+    def obter(self, sessao_id: Optional[str]) -> Tuple[str, JogoWeb, bool]:
+        agora = time.monotonic()
+        despejados: List[JogoWeb] = []
+        with self._lock:
+            item = self._sessoes.get(sessao_id) if sessao_id else None
+            nova = item is None
+            if nova:
+                sessao_id = secrets.token_urlsafe(16)
+                jogo = JogoWeb(ponderar=self.ponderar, tt_mb=self.tt_mb, vagas_ponder=self._vagas_ponder)
+                self.criadas += 1
+            else:
+                jogo = item[0]
+                self._sessoes.move_to_end(sessao_id)
+            self._sessoes[sessao_id] = (jogo, agora)
+            # a memoria muda com a partida, entao a conta de cada sessao é refeita quando ela é usada
+            memoria = jogo.memoria_estimada()
+            self._memoria_total += memoria - self._memoria.get(sessao_id, 0)
+            self._memoria[sessao_id] = memoria
+            despejados = self._despejar(agora)
+        for velho in despejados: # fora do lock, fechar pode esperar a thread da ponderacao
+            velho.fechar()
+        return sessao_id, jogo, nova
+
+    def _despejar(self, agora: float) -> List[JogoWeb]:
+        despejados = []
+        limite = self.memoria_mb * 1024 * 1024 if self.memoria_mb else None
+        while len(self._sessoes) > 1: # a ultima é a que acabou de ser usada, essa fica
+            sessao_id, (jogo, acesso) = next(iter(self._sessoes.items()))
+            if (agora - acesso <= self.tempo_ocioso and len(self._sessoes) <= self.max_sessoes
+                    and (limite is None or self._memoria_total <= limite)):
+                break
+            del self._sessoes[sessao_id]
+            self._memoria_total -= self._memoria.pop(sessao_id)
+            self.despejadas += 1
+            despejados.append(jogo)
+        return despejados
+
+    def remover(self, sessao_id: str) -> None:
+        with self._lock:
+            item = self._sessoes.pop(sessao_id, None)
+            if item is not None:
+                self._memoria_total -= self._memoria.pop(sessao_id)
+        if item is not None:
+            item[0].fechar()
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'sessoes': len(self._sessoes),
+                'max_sessoes': self.max_sessoes,
+                'memoria_mb': self._memoria_total / (1024 * 1024),
+                'memoria_max_mb': self.memoria_mb,
+                'criadas': self.criadas,
+                'despejadas': self.despejadas,
+            }
+
+
+class ServicoAnalise:
+    # /api/analisar: um pool de processos so pro servidor inteiro, criado uma vez no comeco
+    # no maximo max_pedidos lotes rodando ao mesmo tempo e max_posicoes por lote, o resto é recusado na hora
+    MAX_PROFUNDIDADE = 8
+    MAX_TEMPO = 60.0
+
+    def __init__(self, workers: int = 1, max_pedidos: int = 2, max_posicoes: int = 1000, tt_mb: float = 4.0):
+        self.workers = max(1, workers)
+        self.max_posicoes = max_posicoes
+        self.tt_mb = tt_mb
+        self._pedidos = threading.BoundedSemaphore(max(1, max_pedidos))
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        # os processos nascem no primeiro submit: faz ele aqui, antes do servidor abrir as threads
+        self._pool.submit(os.getpid).result()
+
+    # quem conseguiu a vaga (tentar_iniciar True) chama terminar no fim, mesmo se deu erro
+    def tentar_iniciar(self) -> bool: # False se ja tem max_pedidos rodando
+        return self._pedidos.acquire(blocking=False)
+
+    def terminar(self) -> None:
+        self._pedidos.release()
+
+    def analisar(self, posicoes: List[Tuple[str, int]], profundidade: int, limite_tempo: float):
+        return analisar(posicoes, min(max(profundidade, 1), self.MAX_PROFUNDIDADE), min(limite_tempo, self.MAX_TEMPO),
+                        self.workers, {'tt_mb': self.tt_mb}, pool=self._pool)
+
+    def fechar(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
 # essa parte a estrutura da interface web foi feita com IA, apenas fizemos pequenos ajustes manuais
 class GameHandler(http.server.SimpleHTTPRequestHandler):
-    def __init__(self, *args, jogo_instance=None, **kwargs):
+    # com sessoes cada navegador tem a propria partida (cookie "sessao", ou o cabecalho X-Sessao pra clientes
+    # sem cookie), com jogo_instance todo mundo divide a mesma
+    protocol_version = 'HTTP/1.1' # keep-alive: toda resposta manda Content-Length, menos os eventos que fecham a conexao
+
+    def __init__(self, *args, jogo_instance=None, sessoes: Optional[SessoesJogo] = None,
+                 analise: Optional[ServicoAnalise] = None, **kwargs):
         self.jogo = jogo_instance
+        self.sessoes = sessoes
+        self.analise = analise
+        self.sessao_nova: Optional[str] = None
         super().__init__(*args, **kwargs)
+
+    def _carregar_sessao(self):
+        if self.sessoes is None:
+            return
+        sessao_id = self.headers.get('X-Sessao')
+        if not sessao_id:
+            cookie = SimpleCookie(self.headers.get('Cookie', ''))
+            sessao_id = cookie['sessao'].value if 'sessao' in cookie else None
+        sessao_id, self.jogo, nova = self.sessoes.obter(sessao_id)
+        self.sessao_nova = sessao_id if nova else None
+
+    def _cabecalho_sessao(self):
+        if self.sessao_nova is not None:
+            self.send_header('Set-Cookie', f'sessao={self.sessao_nova}; Path=/; HttpOnly; SameSite=Lax')
+            self.send_header('X-Sessao', self.sessao_nova)
         
     def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if self.sessoes is not None and self.path == '/api/sessoes':
+            self.serve_json(self.sessoes.estatisticas())
+            return
+        self._carregar_sessao()
         if self.path == '/':
             self.serve_game_page()
         elif self.path == '/api/estado':
             self.serve_json(self.jogo.obter_estado())
+        elif self.path == '/api/eventos':
+            self.serve_eventos()
+        elif url.path == '/api/job':
+            job_id = urllib.parse.parse_qs(url.query).get('id', [''])[0]
+            self.serve_json(self.jogo.estado_job(job_id))
         else:
             super().do_GET()
             
     def do_POST(self):
-        content_length = int(self.headers['Content-Length'])
+        content_length = int(self.headers.get('Content-Length', 0))
+        if self.path == '/api/analisar' and content_length > self.MAX_CORPO_ANALISE:
+            self.send_error(413, 'Lote grande demais') # sem ler o corpo, entao a conexao fecha
+            self.close_connection = True
+            return
         post_data = self.rfile.read(content_length)
+        if self.path == '/api/analisar': # nao mexe em partida nenhuma, nao precisa de sessao
+            self.serve_analise(post_data)
+            return
+        self._carregar_sessao()
         
         if self.path == '/api/novo_jogo':
             data = json.loads(post_data.decode('utf-8'))
@@ -178,23 +596,130 @@ class GameHandler(http.server.SimpleHTTPRequestHandler):
             self.serve_json(resultado)
             
         elif self.path == '/api/movimento_ia':
-            resultado = self.jogo.fazer_movimento_ia()
+            resultado = self.jogo.iniciar_movimento_ia()
             self.serve_json(resultado)
             
         elif self.path == '/api/cancelar_origem':
-            self.jogo.posicao_origem = None
-            self.jogo.mensagem_status = "Sua vez!"
+            self.jogo.cancelar_origem()
             self.serve_json({'sucesso': True})
+
+        else: # com keep-alive o cliente ficaria esperando uma resposta que nunca vem
+            self.send_error(404)
             
     def serve_json(self, data):
+        corpo = json.dumps(data).encode()
         self.send_response(200)
         self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo))) # sem isso o navegador nao sabe onde a resposta acaba e nao reusa a conexao
         self.send_header('Access-Control-Allow-Origin', '*')
+        self._cabecalho_sessao()
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.wfile.write(corpo)
         
+    # server-sent events: manda o estado inteiro cada vez que ele muda, a conexao fica aberta
+    # sem mudanca so vai um comentario de vez em quando pra conexao nao cair por inatividade
+    INTERVALO_PING = 15.0
+
+    def serve_eventos(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close') # o stream nao tem tamanho, termina fechando a conexao
+        self._cabecalho_sessao()
+        self.end_headers()
+        try:
+            versao = int(self.headers.get('Last-Event-ID', -1)) # o EventSource manda na reconexao
+        except ValueError:
+            versao = -1
+        try:
+            while True:
+                r = self.jogo.esperar_estado(versao, self.INTERVALO_PING)
+                if r is not None:
+                    versao, estado = r
+                    self.wfile.write(f"id: {versao}\nevent: estado\ndata: {estado}\n\n".encode())
+                elif self.jogo.fechado: # a sessao saiu da memoria, o navegador reconecta e ganha outra
+                    break
+                else:
+                    self.wfile.write(b": ping\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    # analise em lote (ServicoAnalise): {"posicoes": [["texto", vez], ...], "profundidade", "limite_tempo"}
+    # devolve um json por linha (ndjson) pra cada posicao assim que ela termina, na ordem em que terminam
+    MAX_CORPO_ANALISE = 1 << 20
+
+    def serve_analise(self, post_data: bytes):
+        if self.analise is None:
+            self.send_error(404, 'Analise desligada neste servidor')
+            return
+        try:
+            data = json.loads(post_data.decode('utf-8'))
+            posicoes = []
+            for p in data['posicoes']:
+                if isinstance(p, dict):
+                    posicoes.append((p['posicao'], int(p.get('vez', 1))))
+                else:
+                    posicoes.append((p[0], int(p[1])))
+            profundidade = int(data.get('profundidade', 4))
+            limite_tempo = float(data.get('limite_tempo', 30.0))
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            self.send_error(400, f'Pedido de analise invalido: {e}')
+            return
+        if len(posicoes) > self.analise.max_posicoes:
+            self.send_error(413, f'No maximo {self.analise.max_posicoes} posicoes por pedido')
+            return
+        if not self.analise.tentar_iniciar():
+            self.send_response(429)
+            self.send_header('Retry-After', '5')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        resultados = self.analise.analisar(posicoes, profundidade, limite_tempo)
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close') # o tamanho so se sabe no fim, termina fechando a conexao
+            self.end_headers()
+            for r in resultados:
+                self.wfile.write(json.dumps(r).encode() + b'\n')
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            resultados.close() # cancela as posicoes que nem comecaram
+            self.analise.terminar()
+
     def serve_game_page(self):
-        html = """
+        etag = _PAGINA.etag
+        if _etag_confere(self.headers.get('If-None-Match'), etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            self._cabecalho_sessao()
+            self.end_headers()
+            return
+        codificacao = _escolher_codificacao(self.headers.get('Accept-Encoding', ''))
+        corpo = _PAGINA.corpos[codificacao]
+        self.send_response(200)
+        self.send_header('Content-type', 'text/html; charset=utf-8')
+        if codificacao != 'identity':
+            self.send_header('Content-Encoding', codificacao)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache') # sempre revalida, mas a resposta de quem ja tem a pagina é um 304 vazio
+        self.send_header('Vary', 'Accept-Encoding')
+        self._cabecalho_sessao()
+        self.end_headers()
+        self.wfile.write(corpo)
+
+
+# a pagina nao muda enquanto o servidor roda: é montada e comprimida uma vez so, na importacao,
+# e cada GET / so escolhe qual dos corpos prontos mandar (ou um 304 se o navegador ja tem)
+PAGINA_HTML = """
 <!DOCTYPE html>
 <html lang="pt-BR">
 <head>
@@ -474,6 +999,24 @@ class GameHandler(http.server.SimpleHTTPRequestHandler):
             })
             .then(response => response.json())
             .then(data => {
+                if (!data.sucesso) {
+                    aguardandoIA = false;
+                    atualizarInterface();
+                    return;
+                }
+                esperarJob(data.job);
+            });
+        }
+
+        // a busca roda no servidor em segundo plano, aqui so pergunta se o job ja terminou
+        function esperarJob(jobId) {
+            fetch('/api/job?id=' + jobId)
+            .then(response => response.json())
+            .then(data => {
+                if (data.sucesso && data.status === 'rodando') {
+                    setTimeout(() => esperarJob(jobId), 200);
+                    return;
+                }
                 aguardandoIA = false;
                 atualizarInterface();
             });
@@ -492,15 +1035,26 @@ class GameHandler(http.server.SimpleHTTPRequestHandler):
             });
         }
 
+        // o servidor empurra o estado por /api/eventos sempre que ele muda, entao nao precisa perguntar.
+        // sem EventSource no navegador volta a buscar /api/estado depois de cada acao
+        let fonteEventos = null;
+        if (window.EventSource) {
+            fonteEventos = new EventSource('/api/eventos');
+            fonteEventos.addEventListener('estado', e => mostrarEstado(JSON.parse(e.data)));
+        }
+
+        function mostrarEstado(data) {
+            estadoJogo = data;
+            atualizarTabuleiro();
+            atualizarStatus();
+            atualizarEstoque();
+        }
+
         function atualizarInterface() {
+            if (fonteEventos) return;
             fetch('/api/estado')
             .then(response => response.json())
-            .then(data => {
-                estadoJogo = data;
-                atualizarTabuleiro();
-                atualizarStatus();
-                atualizarEstoque();
-            });
+            .then(mostrarEstado);
         }
 
         function atualizarTabuleiro() {
@@ -550,27 +1104,86 @@ class GameHandler(http.server.SimpleHTTPRequestHandler):
     </script>
 </body>
 </html>
-        """
-        
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html; charset=utf-8')
-        self.end_headers()
-        self.wfile.write(html.encode('utf-8'))
+"""
+
+
+class _PaginaEstatica:
+    def __init__(self, html: str):
+        bruto = html.encode('utf-8')
+        self.corpos = {
+            'gzip': gzip.compress(bruto, 9, mtime=0), # mtime fixo, senao o gzip muda a cada execucao
+            'deflate': zlib.compress(bruto, 9),       # "deflate" no http é o formato zlib
+            'identity': bruto,
+        }
+        # a mesma etag serve pras tres codificacoes: o conteudo é o mesmo e o Vary separa nos caches
+        self.etag = '"' + hashlib.sha1(bruto).hexdigest()[:20] + '"'
+
+
+_PAGINA = _PaginaEstatica(PAGINA_HTML)
+
+
+def _escolher_codificacao(accept_encoding: str) -> str:
+    # Accept-Encoding com pesos ("gzip;q=0.8, deflate"), empate fica com a ordem de preferencia nossa
+    pesos: Dict[str, float] = {}
+    for item in accept_encoding.split(','):
+        nome, _, params = item.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            chave, _, valor = param.strip().partition('=')
+            if chave == 'q':
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        if nome:
+            pesos[nome.strip().lower()] = q
+    melhor, melhor_q = 'identity', 0.0 # sem comprimir so se o navegador nao aceitar nenhuma das duas
+    for nome in ('gzip', 'deflate'):
+        q = pesos.get(nome, pesos.get('*', 0.0))
+        if q > melhor_q:
+            melhor, melhor_q = nome, q
+    return melhor
+
+
+def _etag_confere(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for item in if_none_match.split(','):
+        item = item.strip()
+        if item == '*' or item.removeprefix('W/') == etag:
+            return True
+    return False
 
 
 def main():
-    jogo = JogoWeb()
+    parser = argparse.ArgumentParser(description="Interface web do Nhac Nhac")
+    parser.add_argument("--porta", type=int, default=8000)
+    parser.add_argument("--max-sessoes", type=int, default=1000, help="partidas ao mesmo tempo no processo")
+    parser.add_argument("--ocioso", type=float, default=1800.0, help="segundos sem uso ate a partida sair da memoria")
+    parser.add_argument("--memoria-mb", type=float, default=512.0, help="memoria estimada maxima somando as partidas")
+    parser.add_argument("--tt-mb", type=float, default=0.5, help="tabela de transposicao da IA de cada partida")
+    parser.add_argument("--ponderar", action="store_true", help="IA busca enquanto o humano pensa")
+    parser.add_argument("--max-ponder", type=int, default=1, help="partidas ponderando ao mesmo tempo (com --ponderar)")
+    parser.add_argument("--analise-workers", type=int, default=os.cpu_count() or 1,
+                        help="processos do pool da /api/analisar, dividido entre todos os pedidos (0 desliga)")
+    parser.add_argument("--analise-pedidos", type=int, default=2, help="lotes de analise rodando ao mesmo tempo")
+    parser.add_argument("--analise-max-posicoes", type=int, default=1000, help="posicoes por lote de analise")
+    args = parser.parse_args()
+
+    sessoes = SessoesJogo(args.max_sessoes, args.ocioso, args.memoria_mb, args.tt_mb, args.ponderar, args.max_ponder)
+    analise = (ServicoAnalise(args.analise_workers, args.analise_pedidos, args.analise_max_posicoes)
+               if args.analise_workers > 0 else None)
     
     def handler(*args, **kwargs):
-        GameHandler(*args, jogo_instance=jogo, **kwargs)
+        GameHandler(*args, sessoes=sessoes, analise=analise, **kwargs)
     
-    port = 8000
+    port = args.porta
     print(f"🎯 Nhac Nhac - Interface Web")
     print(f"Servidor iniciando na porta {port}")
     print(f"Abra seu navegador em: http://localhost:{port}")
     
     try:
-        with socketserver.TCPServer(("", port), handler) as httpd:
+        with http.server.ThreadingHTTPServer(("", port), handler) as httpd:
             # tenta abrir o navegador automaticamente
             try:
                 webbrowser.open(f'http://localhost:{port}')
@@ -585,7 +1198,7 @@ def main():
         if "Address already in use" in str(e):
             print(f"Porta {port} já está em uso. Tentando porta {port+1}...")
             port += 1
-            with socketserver.TCPServer(("", port), handler) as httpd:
+            with http.server.ThreadingHTTPServer(("", port), handler) as httpd:
                 print(f"Servidor iniciado na porta {port}")
                 print(f"Abra seu navegador em: http://localhost:{port}")
                 try:
@@ -0,0 +1,153 @@
+from __future__ import annotations
+import argparse
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from Tabuleiro import Jogador, Peca, MOVIMENTOS, CODIGO_MOVIMENTO, canonizar_codigo, destransformar_movimento
+from TabuleiroBits import TabuleiroBits
+from Tablebase import chave_posicao
+
+# livro de aberturas: o melhor movimento ja buscado fundo pra todas as posicoes dos primeiros plies
+# no comeco todo place é valido e a busca é a mais cara da partida, mas as posicoes sao sempre as mesmas
+# as posicoes ficam na forma canonica (mesma chave da tablebase), entao as 8 simetrias dividem a entrada
+# e o movimento guardado é o do tabuleiro canonico, a consulta desfaz a simetria
+#
+# quantas posicoes canonicas (contando as duas vezes) ate cada ply:
+#   1: 20, 2: 254, 3: 2780, 4: 32678, 5: 237902
+
+# formato do arquivo: cabecalho e depois as posicoes ordenadas pela chave, cada uma (chave, score, movimento)
+_MAGICO = b"NNLA"
+_VERSAO = 1
+_CABECALHO = struct.Struct("<4sHHII") # magico, versao, profundidade da busca, plies, num_posicoes
+_REGISTRO = struct.Struct("<QhB")     # movimento no CODIGO_MOVIMENTO
+
+
+def _oponente(j: Jogador) -> Jogador:
+    return Jogador.IA if j == Jogador.JOGADOR else Jogador.JOGADOR
+
+
+def posicoes_ate(plies: int) -> List[int]:
+    # chaves de todas as posicoes sem ganhador e com movimento ate plies lances do tabuleiro vazio,
+    # com qualquer um dos dois comecando (na interface a IA pode comecar)
+    nivel = [chave_posicao(0, Jogador.JOGADOR), chave_posicao(0, Jogador.IA)]
+    vistas = set(nivel)
+    chaves = []
+    for ply in range(plies + 1):
+        proximo = []
+        for chave in nivel:
+            codigo, j = chave >> 1, Jogador((chave & 1) + 1)
+            tab = TabuleiroBits.de_codigo(codigo)
+            movimentos = tab.movimentos_possiveis(j)
+            if tab.ganhador() is not None or not movimentos:
+                continue
+            chaves.append(chave)
+            if ply == plies:
+                continue
+            for mv in movimentos:
+                desfazer = tab.aplicar_movimento(j, mv)
+                filho = chave_posicao(tab.pecas, _oponente(j))
+                tab.desfazer_movimento(desfazer)
+                if filho not in vistas:
+                    vistas.add(filho)
+                    proximo.append(filho)
+        nivel = proximo
+    return chaves
+
+
+def _buscar_posicao(args: Tuple[int, int]) -> Tuple[int, Optional[Peca.Move], float]:
+    from IA import IA_Minimax # aqui dentro porque a IA importa o livro
+    chave, profundidade = args
+    tab = TabuleiroBits.de_codigo(chave >> 1).para_tabuleiro()
+    ia = IA_Minimax(profundidade, None) # IA nova em cada posicao, o resultado nao depende da ordem
+    mv, est = ia.buscar(tab, Jogador((chave & 1) + 1))
+    return chave, mv, est.score or 0.0
+
+
+def gerar(plies: int, profundidade: int, workers: int = 1) -> Dict[int, Tuple[Peca.Move, float]]:
+    # {chave_posicao: (movimento no tabuleiro canonico, score pra quem tem a vez)}
+    tarefas = [(chave, profundidade) for chave in posicoes_ate(plies)]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            resultados = list(pool.map(_buscar_posicao, tarefas, chunksize=8))
+    else:
+        resultados = [_buscar_posicao(t) for t in tarefas]
+    return {chave: (mv, score) for chave, mv, score in resultados if mv is not None}
+
+
+def gravar(caminho: str, livro: Dict[int, Tuple[Peca.Move, float]], profundidade: int, plies: int) -> None:
+    buf = bytearray(_CABECALHO.size + len(livro) * _REGISTRO.size)
+    _CABECALHO.pack_into(buf, 0, _MAGICO, _VERSAO, profundidade, plies, len(livro))
+    for i, chave in enumerate(sorted(livro)):
+        mv, score = livro[chave]
+        score = max(-32768, min(32767, round(score)))
+        _REGISTRO.pack_into(buf, _CABECALHO.size + i * _REGISTRO.size, chave, score, CODIGO_MOVIMENTO[mv])
+    with open(caminho, "wb") as f:
+        f.write(buf)
+
+
+class LivroAberturas:
+    # so le o arquivo na primeira consulta, criar a IA com o livro nao custa nada
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._posicoes: Optional[Dict[int, Tuple[int, int]]] = None
+        self._profundidade = 0
+        self._plies = 0
+        self.consultas = 0
+        self.acertos = 0
+
+    def _carregar(self) -> Dict[int, Tuple[int, int]]:
+        if self._posicoes is None:
+            with open(self.caminho, "rb") as f:
+                dados = f.read()
+            magico, versao, self._profundidade, self._plies, num = _CABECALHO.unpack_from(dados, 0)
+            if magico != _MAGICO or versao != _VERSAO:
+                raise ValueError(f"Arquivo {self.caminho} nao é um livro de aberturas valido")
+            registros = _REGISTRO.iter_unpack(memoryview(dados)[_CABECALHO.size:_CABECALHO.size + num * _REGISTRO.size])
+            self._posicoes = {chave: (score, mv) for chave, score, mv in registros}
+        return self._posicoes
+
+    @property
+    def profundidade(self) -> int: # profundidade da busca que gerou o livro
+        self._carregar()
+        return self._profundidade
+
+    @property
+    def plies(self) -> int:
+        self._carregar()
+        return self._plies
+
+    def __len__(self) -> int:
+        return len(self._carregar())
+
+    def consultar(self, codigo: int, vez: Jogador) -> Optional[Tuple[Peca.Move, float]]:
+        # (movimento ja no tabuleiro original, score pra quem tem a vez), ou None se a posicao nao esta no livro
+        posicoes = self._carregar()
+        self.consultas += 1
+        canonico, sim = canonizar_codigo(codigo)
+        entrada = posicoes.get(canonico << 1 | (int(vez) - 1))
+        if entrada is None:
+            return None
+        self.acertos += 1
+        score, mv = entrada
+        return destransformar_movimento(MOVIMENTOS[mv], sim), float(score)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera o livro de aberturas da IA")
+    parser.add_argument("saida", help="arquivo do livro")
+    parser.add_argument("--plies", type=int, default=3, help="posicoes ate quantos lances do tabuleiro vazio")
+    parser.add_argument("--profundidade", type=int, default=6, help="profundidade da busca em cada posicao")
+    parser.add_argument("--workers", type=int, default=1, help="processos buscando em paralelo")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    livro = gerar(args.plies, args.profundidade, args.workers)
+    gravar(args.saida, livro, args.profundidade, args.plies)
+    print(f"{len(livro)} posicoes ate {args.plies} plies na profundidade {args.profundidade} "
+          f"em {time.time() - t0:.1f}s -> {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,162 @@
 from __future__ import annotations
 import argparse
+import json
+import sys
+import time
 from NhacNhac import Jogo
 
+# sem subcomando abre o jogo no terminal, com subcomando roda sem input e imprime json na saida:
+#   analyze --vez 2 --prof 6 -- "-/-/-/-/1/-/-/-/-"  melhor movimento, score e estatisticas da busca
+#                                                  (o -- é porque a posicao pode comecar com "-" e o argparse acharia que é opcao)
+#   bench --prof 4                                 nos/s no corpus fixo do Benchmark
+#   selfplay --partidas 10 --a "profundidade_maxima=3" --b "profundidade_maxima=4"   partidas entre duas configuracoes
+
+
+# a IA guarda killers ate essa profundidade (IA._PROFUNDIDADE_SEM_LIMITE), mais fundo que isso nao da
+_PROF_MAX = 64
+
+
+def _profundidade(txt: str) -> int:
+    prof = int(txt)
+    if not 1 <= prof <= _PROF_MAX:
+        raise argparse.ArgumentTypeError(f"profundidade tem que estar entre 1 e {_PROF_MAX}")
+    return prof
+
+
+def _imprimir(dados) -> None:
+    print(json.dumps(dados, indent=2))
+
+
+def _analyze(args) -> int:
+    from Tabuleiro import Tabuleiro, Jogador
+    from IA import IA_Minimax
+    from Analise import movimento_para_dict
+    try:
+        tab = Tabuleiro.de_texto(args.posicao)
+        if args.vez not in (1, 2):
+            raise ValueError(f"Vez invalida, esperava 1 ou 2: {args.vez}")
+    except ValueError as e:
+        _imprimir({"posicao": args.posicao, "vez": args.vez, "erro": str(e)})
+        return 1
+    if tab.ganhador() is not None: # igual o Analise.analisar_posicao, a busca so devolveria um movimento qualquer
+        _imprimir({"posicao": args.posicao, "vez": args.vez, "erro": "Posicao ja tem vencedor"})
+        return 1
+    ia = IA_Minimax(profundidade_maxima=args.prof, limite_tempo=args.tempo, tt_mb=args.tt_mb, estatisticas=True)
+    try:
+        mv, est = ia.buscar(tab, Jogador(args.vez))
+    finally:
+        ia.fechar()
+    _imprimir({
+        "posicao": args.posicao,
+        "vez": args.vez,
+        "movimento": movimento_para_dict(mv),
+        "score": est.score,
+        "variante_principal": [movimento_para_dict(m) for m in ia.variante_principal],
+        "estatisticas": est.como_dict(),
+    })
+    return 0
+
+
+def _bench(args) -> int:
+    from Benchmark import carregar_corpus, medir_busca
+    config = {"tt_mb": args.tt_mb}
+    t0 = time.perf_counter()
+    busca = medir_busca(carregar_corpus(), config, args.prof, args.rodadas)
+    nos = sum(g["nos"] for g in busca.values())
+    tempo = sum(g["tempo"] for g in busca.values())
+    _imprimir({
+        "config": config,
+        "profundidade": args.prof,
+        "busca": busca,
+        "nos": nos,
+        "tempo": tempo,
+        "nos_por_segundo": nos / tempo if tempo else 0.0,
+        "tempo_total": time.perf_counter() - t0, # com as rodadas repetidas, o "tempo" é so o da melhor de cada posicao
+    })
+    return 0
+
+
+def _selfplay(args) -> int:
+    from Torneio import jogar_partida, ler_config
+    _, config_a = ler_config(":" + args.a)
+    _, config_b = ler_config(":" + args.b)
+    padrao = {"profundidade_maxima": args.prof, "limite_tempo": args.tempo, "tt_mb": args.tt_mb}
+    config_a = {**padrao, **config_a} # o que veio no --a/--b ganha dos argumentos gerais
+    config_b = {**padrao, **config_b}
+    partidas = []
+    pontos_a = 0.0
+    motivos = {}
+    t0 = time.perf_counter()
+    for i in range(args.partidas): # alterna quem comeca, e cada par de partidas usa a mesma abertura sorteada
+        p = jogar_partida(config_a, config_b, a_comeca=i % 2 == 0, semente_abertura=args.semente * 1_000_003 + i // 2,
+                          lances_abertura=args.lances_abertura, max_lances=args.max_lances)
+        partidas.append(p)
+        pontos_a += p["pontos_a"]
+        motivos[p["motivo"]] = motivos.get(p["motivo"], 0) + 1
+
+    def resumo(lado: str) -> dict:
+        nos = sum(p[lado]["nos"] for p in partidas)
+        tempo = sum(p[lado]["tempo"] for p in partidas)
+        cpu = sum(p[lado]["cpu"] for p in partidas)
+        lances = sum(p[lado]["lances"] for p in partidas)
+        return {"nos": nos, "tempo_cpu": cpu, "nos_por_segundo": nos / cpu if cpu else 0.0,
+                "tempo_medio_lance": tempo / lances if lances else 0.0}
+
+    _imprimir({
+        "a": {"config": config_a, "pontos": pontos_a, **resumo("stats_a")},
+        "b": {"config": config_b, "pontos": len(partidas) - pontos_a, **resumo("stats_b")},
+        "motivos": motivos,
+        "tempo_total": time.perf_counter() - t0,
+        "partidas": partidas,
+    })
+    return 0
+
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--prof", type=int, default=4, help="Profundidade máxima da IA (máximo: 6)") # a padrao é 4, mas pode mudar no terminal ali pra testes só na hora de colocar tem que ser tipo: --prof x --tempo x 
-    parser.add_argument("--tempo", type=float, default=30.0, help="Limite de tempo por jogada em segundos") #  a padrao é 30 seg, mas pode mudar no terminal ali pra testes
+    # --prof e --tempo valem antes ou depois do subcomando (Main.py --prof 6 bench == Main.py bench --prof 6)
+    # sem valor, o jogo usa 4 e 30s e os subcomandos 4 e sem limite de tempo. so o jogo limita a profundidade em 6
+    parser.add_argument("--prof", type=_profundidade, default=None, help="Profundidade máxima da IA (padrão 4, no jogo máximo 6)") # a padrao é 4, mas pode mudar no terminal ali pra testes só na hora de colocar tem que ser tipo: --prof x --tempo x
+    parser.add_argument("--tempo", type=float, default=None, help="Limite de tempo por jogada em segundos (padrão 30 no jogo)") #  a padrao é 30 seg, mas pode mudar no terminal ali pra testes
+
+    comandos = parser.add_subparsers(dest="comando")
+    analyze = comandos.add_parser("analyze", help="analisa uma posicao (formato do Tabuleiro.para_texto)")
+    analyze.add_argument("posicao", help='ex: -- "-/-/-/-/1/-/-/-/-", casas de cima pra baixo, * marca peca da IA')
+    analyze.add_argument("--vez", type=int, default=1, help="quem joga: 1 jogador, 2 IA")
+    bench = comandos.add_parser("bench", help="nos/s da busca no corpus fixo do Benchmark.py")
+    bench.add_argument("--rodadas", type=int, default=3, help="cada busca roda isso de vezes e fica o melhor tempo")
+    selfplay = comandos.add_parser("selfplay", help="partidas entre duas configuracoes da IA")
+    selfplay.add_argument("--partidas", type=int, default=2)
+    selfplay.add_argument("--a", default="", help="argumentos do IA_Minimax 'chave=valor,...' da configuracao a")
+    selfplay.add_argument("--b", default="", help="idem pra configuracao b")
+    selfplay.add_argument("--lances-abertura", type=int, default=2, help="lances sorteados no comeco de cada partida")
+    selfplay.add_argument("--max-lances", type=int, default=200)
+    selfplay.add_argument("--semente", type=int, default=0)
+    for sub in (analyze, bench, selfplay):
+        # SUPPRESS: sem o flag no subcomando fica o valor que veio antes dele
+        sub.add_argument("--prof", type=_profundidade, default=argparse.SUPPRESS, help="profundidade da busca (padrao 4)")
+        sub.add_argument("--tempo", type=float, default=argparse.SUPPRESS, help="limite de tempo por busca em segundos")
+        sub.add_argument("--tt-mb", type=float, default=16.0)
     args = parser.parse_args()
-    
+
+    if args.comando is not None and args.prof is None:
+        args.prof = 4
+    if args.comando == "analyze":
+        sys.exit(_analyze(args))
+    if args.comando == "bench":
+        sys.exit(_bench(args))
+    if args.comando == "selfplay":
+        sys.exit(_selfplay(args))
+
+    prof = args.prof if args.prof is not None else 4
+    tempo = args.tempo if args.tempo is not None else 30.0
     # Limitar profundidade máxima a 6
-    profundidade = min(max(args.prof, 1), 6)
-    if args.prof > 6:
-        print(f"Aviso: Profundidade limitada a 6 (valor solicitado: {args.prof})")
+    profundidade = min(max(prof, 1), 6)
+    if prof > 6:
+        print(f"Aviso: Profundidade limitada a 6 (valor solicitado: {prof})")
 
-    jogo = Jogo(profundidade_ia=profundidade, limite_tempo_ia=args.tempo)
+    jogo = Jogo(profundidade_ia=profundidade, limite_tempo_ia=tempo)
     jogo.executar()
 
 if __name__ == "__main__": # roda só se executar o main.py
-    main()
\ No newline at end of file
+    main()
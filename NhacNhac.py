@@ -1,8 +1,8 @@
 from __future__ import annotations
 import time
-from typing import Optional
+from typing import Dict, Optional
 
-from Tabuleiro import Tabuleiro, Jogador, Tamanho, Peca, Pos
+from Tabuleiro import Tabuleiro, Jogador, Tamanho, Peca, Pos, REPETICOES_EMPATE, chave_repeticao
 from IA import IA_Minimax 
 
 def _parse_pos(txt: str) -> Optional[Pos]:
@@ -43,6 +43,12 @@ class Jogo:
         self.jogador_ia = Jogador.IA
         self.jogador_atual = self.jogador_humano  # default
         self.ia = IA_Minimax(profundidade_maxima=profundidade_ia, limite_tempo=limite_tempo_ia)
+        self.historico: Dict[int, int] = {} # quantas vezes cada posicao (com a vez) apareceu, pra empate por repeticao
+
+    def _registrar_posicao(self) -> bool: # true se a posicao atual repetiu vezes suficientes pra empatar
+        chave = chave_repeticao(self.tab.codigo, self.jogador_atual)
+        self.historico[chave] = self.historico.get(chave, 0) + 1
+        return self.historico[chave] >= REPETICOES_EMPATE
 
     def configurar_inicio(self):
         print(" NHAC NHAC ")
@@ -129,7 +135,8 @@ class Jogo:
     def _turno_ia(self):
         print("\nIA pensando...")
         t0 = time.time()
-        mv = self.ia.obter_melhor_movimento(self.tab, self.jogador_ia)
+        mv, est = self.ia.buscar(self.tab, self.jogador_ia, self.historico)
+        print(est.resumo())
         if mv is None:
             print("IA não encontrou movimentos (isso não deveria acontecer se o jogo não tem empates).")
             return
@@ -147,8 +154,9 @@ class Jogo:
 
     def executar(self):
         self.configurar_inicio()
+        empate = self._registrar_posicao()
 
-        while not self.tab.acabou():
+        while not self.tab.acabou() and not empate:
             if self.jogador_atual == self.jogador_humano:
                 self._turno_humano()
                 if self.tab.acabou():
@@ -159,6 +167,7 @@ class Jogo:
                 if self.tab.acabou():
                     break
                 self.jogador_atual = self.jogador_humano
+            empate = self._registrar_posicao()
 
         vencedor = self.tab.ganhador()
         print("\n=== FIM DE JOGO ===")
@@ -167,6 +176,8 @@ class Jogo:
             print("Parabéns, você venceu!")
         elif vencedor == self.jogador_ia:
             print("A IA venceu!")
+        elif empate:
+            print(f"Empate: a mesma posição se repetiu {REPETICOES_EMPATE} vezes.")
         else:
             print("Jogo encerrado.")
 
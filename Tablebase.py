@@ -0,0 +1,219 @@
+from __future__ import annotations
+import argparse
+import mmap
+import struct
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from Tabuleiro import Tabuleiro, Jogador, canonizar_codigo
+from TabuleiroBits import TabuleiroBits
+
+# solucionador por analise retrograda e a tablebase em disco que a IA consulta
+# a ideia: enumera todas as posicoes alcancaveis a partir de uma raiz, marca as que ja tem ganhador
+# e vai voltando: quem pode mover pra uma posicao perdida pro adversario ganha, quem so tem movimentos
+# pra posicoes ganhas pro adversario perde, e o que sobrar no fim é empate (da pra ficar deslizando pra sempre)
+#
+# o espaco é grande demais pra python puro na pratica: a partir do tabuleiro vazio sao ~1423^3 * 2 ≈ 5.8 bilhoes de
+# estados (por tamanho sao 1423 jeitos de espalhar 0-2 pecas de cada jogador), e pouca peca no estoque nao salva,
+# porque deslizando as pecas voltam pra qualquer lugar: so com as 12 pecas no tabuleiro sao 756^3 ≈ 430 milhoes
+# de arranjos, e a raiz "123/12*3*/-/1*2/-/3/1*3*/-/2*" passa das 5 milhoes de posicoes (~4.5 min) sem terminar.
+# posicoes tiradas de partidas com 4 a 9 pecas no tabuleiro passaram todas de 200 mil. entao nao tem raiz padrao,
+# é pra raizes escolhidas na mao em que quase toda linha acaba em vitoria logo, com limite_posicoes pra nao
+# estourar a memoria
+# as posicoes sao guardadas na forma canonica (menor das 8 simetrias), o que corta o arquivo em ate 8x
+
+# resultado pra quem tem a vez
+VITORIA = 1
+DERROTA = 2
+EMPATE = 3
+
+_MAX_DISTANCIA = (1 << 14) - 1
+
+# formato do arquivo: cabecalho e depois uma tabela hash com enderecamento aberto (sondagem linear)
+# cada slot é (chave+1, valor), chave 0 marca slot vazio. valor = resultado << 14 | distancia em plies
+_MAGICO = b"NNTB"
+_VERSAO = 3 # 2: chaves na forma canonica, 3: faixa de pecas no tabuleiro no cabecalho
+# magico, versao, reservado, num_slots, num_posicoes, menor e maior numero de pecas no tabuleiro entre as posicoes
+_CABECALHO = struct.Struct("<4sHHQQHH")
+_SLOT = struct.Struct("<QH")
+_MULT = 0x9E3779B97F4A7C15
+_M64 = (1 << 64) - 1
+
+
+def chave_posicao(codigo: int, vez: Jogador) -> int: # codigo canonico do TabuleiroBits (54 bits) + 1 bit da vez
+    return canonizar_codigo(codigo)[0] << 1 | (int(vez) - 1)
+
+
+def _oponente(j: Jogador) -> Jogador:
+    return Jogador.IA if j == Jogador.JOGADOR else Jogador.JOGADOR
+
+
+def resolver(codigo_raiz: int, vez: Jogador, limite_posicoes: Optional[int] = None) -> Dict[int, Tuple[int, int]]:
+    # devolve {chave_posicao: (resultado, distancia)} pra todas as posicoes alcancaveis da raiz
+    # posicoes simetricas viram um estado so, o valor delas é o mesmo
+    ids: Dict[int, int] = {chave_posicao(codigo_raiz, vez): 0}
+    chaves: List[int] = [chave_posicao(codigo_raiz, vez)]
+    antecessores: List[List[int]] = [[]]
+    faltam: List[int] = []       # sucessores ainda nao resolvidos como vitoria do adversario
+    resultado: List[int] = []
+    distancia: List[int] = []
+    fila = deque()
+
+    # 1) enumera as posicoes em largura, guardando quem leva a quem
+    i = 0
+    while i < len(chaves):
+        chave = chaves[i]
+        codigo, j = chave >> 1, Jogador((chave & 1) + 1)
+        tab = TabuleiroBits.de_codigo(codigo)
+        resultado.append(0)
+        distancia.append(0)
+
+        vencedor = tab.ganhador()
+        if vencedor is not None: # posicao final, o jogo parou aqui
+            faltam.append(0)
+            resultado[i] = VITORIA if vencedor == j else DERROTA
+            fila.append(i)
+            i += 1
+            continue
+
+        outro = _oponente(j)
+        filhos = []
+        for mv in tab.movimentos_possiveis(j):
+            desfazer = tab.aplicar_movimento(j, mv)
+            filhos.append(chave_posicao(tab.pecas, outro))
+            tab.desfazer_movimento(desfazer)
+        if not filhos: # sem movimento o jogador passa a vez
+            filhos.append(chave_posicao(codigo, outro))
+
+        faltam.append(len(filhos))
+        for filho in filhos:
+            k = ids.get(filho)
+            if k is None:
+                k = len(chaves)
+                if limite_posicoes is not None and k >= limite_posicoes:
+                    raise ValueError(f"Mais de {limite_posicoes} posicoes alcancaveis, aumente o limite ou use outra raiz")
+                ids[filho] = k
+                chaves.append(filho)
+                antecessores.append([])
+            antecessores[k].append(i)
+        i += 1
+
+    # 2) analise retrograda, a fila em largura garante a menor distancia pra vitoria e a maior pra derrota
+    while fila:
+        s = fila.popleft()
+        for p in antecessores[s]:
+            if resultado[p]:
+                continue
+            if resultado[s] == DERROTA: # p pode mover pra uma posicao perdida pro adversario
+                resultado[p] = VITORIA
+                distancia[p] = distancia[s] + 1
+                fila.append(p)
+            else:
+                faltam[p] -= 1
+                if faltam[p] == 0: # todos os movimentos de p dao vitoria pro adversario
+                    resultado[p] = DERROTA
+                    distancia[p] = distancia[s] + 1
+                    fila.append(p)
+
+    return {
+        chave: (resultado[k] or EMPATE, min(distancia[k], _MAX_DISTANCIA))
+        for k, chave in enumerate(chaves)
+    }
+
+
+def _slot_inicial(chave: int, bits: int) -> int:
+    return ((chave * _MULT) & _M64) >> (64 - bits) if bits else 0
+
+
+def gravar(caminho: str, resultados: Dict[int, Tuple[int, int]]) -> None:
+    num_slots = 1
+    while num_slots < 2 * len(resultados): # fator de carga <= 0.5 pra sondagem ficar curta
+        num_slots <<= 1
+    bits = num_slots.bit_length() - 1
+    slots: List[Optional[Tuple[int, int]]] = [None] * num_slots
+    for chave, (res, dist) in resultados.items():
+        i = _slot_inicial(chave, bits)
+        while slots[i] is not None:
+            i = (i + 1) & (num_slots - 1)
+        slots[i] = (chave + 1, res << 14 | dist)
+
+    # peca so entra no tabuleiro, nunca sai, entao a tablebase de uma raiz cobre uma faixa estreita de contagens
+    pecas = [(chave >> 1).bit_count() for chave in resultados] or [0]
+    buf = bytearray(_CABECALHO.size + num_slots * _SLOT.size)
+    _CABECALHO.pack_into(buf, 0, _MAGICO, _VERSAO, 0, num_slots, len(resultados), min(pecas), max(pecas))
+    for i, slot in enumerate(slots):
+        if slot is not None:
+            _SLOT.pack_into(buf, _CABECALHO.size + i * _SLOT.size, *slot)
+    with open(caminho, "wb") as f:
+        f.write(buf)
+
+
+class Tablebase:
+    # leitura da tablebase por mmap, so as paginas consultadas vao pra memoria
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._arquivo = open(caminho, "rb")
+        self._mm = mmap.mmap(self._arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        magico, versao, _, num_slots, num_posicoes, min_pecas, max_pecas = _CABECALHO.unpack_from(self._mm, 0)
+        if magico != _MAGICO or versao != _VERSAO:
+            self.fechar()
+            raise ValueError(f"Arquivo {caminho} nao é uma tablebase valida")
+        self.num_slots = num_slots
+        self.num_posicoes = num_posicoes
+        self.min_pecas = min_pecas
+        self.max_pecas = max_pecas
+        self._bits = num_slots.bit_length() - 1
+        self.sondagens = 0
+        self.acertos = 0
+
+    def sondar(self, codigo: int, vez: Jogador) -> Optional[Tuple[int, int]]:
+        # (resultado, distancia) pra quem tem a vez, ou None se a posicao nao esta na tablebase
+        # a busca sonda todo no, entao o que esta fora da faixa de pecas volta antes de canonizar (8 simetrias)
+        if not self.min_pecas <= codigo.bit_count() <= self.max_pecas:
+            return None
+        self.sondagens += 1
+        chave = chave_posicao(codigo, vez) + 1
+        i = _slot_inicial(chave - 1, self._bits)
+        mascara = self.num_slots - 1
+        while True:
+            guardada, valor = _SLOT.unpack_from(self._mm, _CABECALHO.size + i * _SLOT.size)
+            if guardada == 0:
+                return None
+            if guardada == chave:
+                self.acertos += 1
+                return valor >> 14, valor & _MAX_DISTANCIA
+            i = (i + 1) & mascara
+
+    def fechar(self) -> None:
+        self._mm.close()
+        self._arquivo.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera a tablebase do Nhac Nhac por analise retrograda")
+    parser.add_argument("saida", help="arquivo da tablebase")
+    parser.add_argument("--posicao", required=True, help="raiz no formato do Tabuleiro.para_texto (ver o comentario do topo)")
+    parser.add_argument("--vez", type=int, choices=(1, 2), default=1, help="quem joga na raiz (1=jogador, 2=IA)")
+    parser.add_argument("--limite", type=int, default=5_000_000, help="maximo de posicoes enumeradas")
+    args = parser.parse_args()
+
+    raiz = Tabuleiro.de_texto(args.posicao)
+    vez = Jogador(args.vez)
+    t0 = time.time()
+    resultados = []
+    for j in (vez, _oponente(vez)): # resolve com as duas vezes na raiz, a IA pode pegar a posicao de qualquer lado
+        resultados.append(resolver(raiz.codigo, j, args.limite))
+    todos = {**resultados[0], **resultados[1]}
+    gravar(args.saida, todos)
+    contagem = {VITORIA: 0, DERROTA: 0, EMPATE: 0}
+    for res, _ in todos.values():
+        contagem[res] += 1
+    print(f"{len(todos)} posicoes resolvidas em {time.time() - t0:.1f}s -> {args.saida}")
+    print(f"vitorias: {contagem[VITORIA]}, derrotas: {contagem[DERROTA]}, empates: {contagem[EMPATE]}")
+    res_raiz, dist_raiz = todos[chave_posicao(raiz.codigo, vez)]
+    print(f"raiz: {({VITORIA: 'vitoria', DERROTA: 'derrota', EMPATE: 'empate'})[res_raiz]} em {dist_raiz} plies pra quem tem a vez")
+
+
+if __name__ == "__main__":
+    main()
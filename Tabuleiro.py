@@ -1,5 +1,6 @@
 from __future__ import annotations
 import math
+import random
 from enum import IntEnum
 from typing import List, Optional, Tuple, Dict, Iterable, NamedTuple
 from dataclasses import dataclass
@@ -57,6 +58,157 @@ WIN_LINES: Tuple[Tuple[Pos, Pos, Pos], ...] = ( #linhas que causam uma vitoria p
     (Pos(0,2), Pos(1,1), Pos(2,0)),
 )
 
+# com slide da pra repetir posicao pra sempre, entao a partida empata quando a mesma posicao
+# com a mesma vez aparece pela terceira vez (a busca da IA ja conta a primeira repeticao como empate)
+REPETICOES_EMPATE = 3
+
+def chave_repeticao(codigo: int, vez: Jogador) -> int: # posicao + quem joga, o codigo ja define a posicao inteira
+    return codigo << 1 | (int(vez) - 1)
+
+# chaves de zobrist pra identificar a posicao com um int de 64 bits
+# ZOBRIST[jogador][tamanho][casa], casa = linha*3 + coluna (o indice 0 de jogador/tamanho nao é usado)
+# como a ordem da pilha é implicita pelo tamanho, o xor das pecas de cada casa ja identifica a pilha toda
+# e o estoque tambem, porque ele é o que sobrou fora do tabuleiro
+_rng_zobrist = random.Random(20250828) # semente fixa pra chave ser a mesma em qualquer processo
+ZOBRIST: List[List[List[int]]] = [
+    [[_rng_zobrist.getrandbits(64) for _ in range(9)] for _ in range(4)] for _ in range(3)
+]
+ZOBRIST_VEZ: Dict[Jogador, int] = {j: _rng_zobrist.getrandbits(64) for j in Jogador} # de quem é a vez
+
+# codigo compacto da posicao, o mesmo int do TabuleiroBits.pecas: um bit por jogador/tamanho/casa
+# BIT_PECA[jogador][tamanho][casa] = 1 << (((jogador-1)*3 + (tamanho-1))*9 + casa)
+BIT_PECA: List[List[List[int]]] = [
+    [[1 << (((j - 1) * 3 + (t - 1)) * 9 + c) if j and t else 0 for c in range(9)] for t in range(4)] for j in range(3)
+]
+
+# tabelas da geracao de movimentos, tudo pronto pra gerar os movimentos so com mascaras do codigo
+# (o TabuleiroBits usa as mesmas). a mascara de destinos validos de uma peca de tamanho t é a das casas
+# com topo menor que t, entao a lista de movimentos sai direto indexada por ela
+BITS: Tuple[Tuple[int, ...], ...] = tuple( # BITS[mascara] = casas ligadas naquela mascara, em ordem
+    tuple(c for c in range(9) if m >> c & 1) for m in range(1 << 9)
+)
+# PLACE_LISTAS[tamanho][mascara de destinos] e SLIDE_LISTAS[origem][mascara de destinos]
+PLACE_LISTAS: Dict[Tamanho, Tuple[Tuple[Peca.Move, ...], ...]] = {}
+for _t in Tamanho:
+    _movs = [Peca.Move("place", _t, None, pos) for pos in ALL_POS]
+    PLACE_LISTAS[_t] = tuple(tuple(_movs[c] for c in BITS[m]) for m in range(1 << 9))
+SLIDE_LISTAS: Tuple[Tuple[Tuple[Peca.Move, ...], ...], ...] = tuple(
+    tuple(tuple(Peca.Move("slide", None, ALL_POS[o], ALL_POS[d]) for d in BITS[m]) for m in range(1 << 9))
+    for o in range(9)
+)
+# cada movimento possivel num codigo de 7 bits, pra guardar em arquivo ou memoria compartilhada
+# 0 = nenhum, 1..27 = place (tamanho, destino), 28..108 = slide (origem, destino)
+MOVIMENTOS: Tuple[Optional[Peca.Move], ...] = (None,) + tuple(
+    Peca.Move("place", t, None, pos) for t in Tamanho for pos in ALL_POS
+) + tuple(Peca.Move("slide", None, org, dst) for org in ALL_POS for dst in ALL_POS)
+CODIGO_MOVIMENTO: Dict[Peca.Move, int] = {mv: i for i, mv in enumerate(MOVIMENTOS) if mv is not None}
+
+
+def movimentos_do_codigo(codigo: int, jogador: Jogador, tamanhos_no_estoque: Iterable[Tamanho]) -> List[Peca.Move]:
+    # places por tamanho e casa, depois slides por origem e destino (a mesma ordem dos lacos antigos)
+    p1, m1, g1 = codigo & 0x1FF, codigo >> 9 & 0x1FF, codigo >> 18 & 0x1FF
+    p2, m2, g2 = codigo >> 27 & 0x1FF, codigo >> 36 & 0x1FF, codigo >> 45 & 0x1FF
+    g = g1 | g2
+    gm = g | m1 | m2
+    vazias = ~(gm | p1 | p2) & 0x1FF
+    menores = (0, vazias, vazias | ((p1 | p2) & ~gm), ~g & 0x1FF) # [t] = destinos validos pra peca t
+
+    moves: List[Peca.Move] = []
+    for t in tamanhos_no_estoque:
+        moves.extend(PLACE_LISTAS[t][menores[t]])
+
+    if jogador == Jogador.JOGADOR:
+        meu_m, meu_g, meus = m1 & ~g, g1, g1 | (m1 & ~g) | (p1 & ~gm)
+    else:
+        meu_m, meu_g, meus = m2 & ~g, g2, g2 | (m2 & ~g) | (p2 & ~gm)
+    for org in BITS[meus]:
+        t = 3 if meu_g >> org & 1 else (2 if meu_m >> org & 1 else 1)
+        moves.extend(SLIDE_LISTAS[org][menores[t]])
+    return moves
+
+
+# mascara de 9 bits de cada linha do WIN_LINES, na mesma ordem
+LINHAS_MASCARAS: Tuple[int, ...] = tuple(
+    sum(1 << (pos.linha * 3 + pos.coluna) for pos in linha) for linha in WIN_LINES
+)
+
+def _ameacas(mascara: int) -> int:
+    r = 0
+    for linha in LINHAS_MASCARAS:
+        if (linha & mascara).bit_count() == 2:
+            r |= linha & ~mascara
+    return r
+
+# AMEACAS[mascara] = casas que fechariam uma linha pra quem tem o topo das casas da mascara
+AMEACAS: Tuple[int, ...] = tuple(_ameacas(m) for m in range(1 << 9))
+
+def visiveis_de(codigo: int) -> Tuple[int, int]: # mascara das casas com topo de cada jogador, direto do codigo
+    g1, g2 = codigo >> 18 & 0x1FF, codigo >> 45 & 0x1FF
+    m1, m2 = codigo >> 9 & 0x1FF, codigo >> 36 & 0x1FF
+    g = g1 | g2
+    gm = g | m1 | m2
+    return (g1 | (m1 & ~g) | (codigo & 0x1FF & ~gm), g2 | (m2 & ~g) | (codigo >> 27 & 0x1FF & ~gm))
+
+
+# linhas do WIN_LINES que passam por cada casa, pra atualizar so essas quando a casa muda de dono
+LINHAS_DA_CASA: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple(i for i, linha in enumerate(WIN_LINES) if pos in linha) for pos in ALL_POS
+)
+
+# simetrias do tabuleiro 3x3: 4 rotacoes e 4 reflexoes, o WIN_LINES nao muda com nenhuma delas
+# entao posicoes simetricas tem o mesmo valor e da pra guardar so uma delas (a de menor codigo)
+# SIMETRIAS[t][casa] = pra onde a casa vai na transformacao t
+_TRANSFORMACOES = (
+    lambda r, c: (r, c),          # identidade
+    lambda r, c: (c, 2 - r),      # gira 90
+    lambda r, c: (2 - r, 2 - c),  # gira 180
+    lambda r, c: (2 - c, r),      # gira 270
+    lambda r, c: (r, 2 - c),      # espelha colunas
+    lambda r, c: (2 - r, c),      # espelha linhas
+    lambda r, c: (c, r),          # diagonal principal
+    lambda r, c: (2 - c, 2 - r),  # diagonal secundaria
+)
+SIMETRIAS: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple(f(r, c)[0] * 3 + f(r, c)[1] for r in range(3) for c in range(3)) for f in _TRANSFORMACOES
+)
+INVERSA: Tuple[int, ...] = tuple(
+    next(u for u in range(8) if all(SIMETRIAS[u][SIMETRIAS[t][c]] == c for c in range(9))) for t in range(8)
+)
+# MASCARA_SIMETRIA[t][mascara de 9 bits] = mascara transformada, pra transformar o codigo inteiro de uma vez
+MASCARA_SIMETRIA: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple(sum(1 << perm[c] for c in range(9) if m >> c & 1) for m in range(1 << 9)) for perm in SIMETRIAS
+)
+
+def transformar_pos(pos: Pos, t: int) -> Pos:
+    return ALL_POS[SIMETRIAS[t][pos.linha * 3 + pos.coluna]]
+
+def transformar_movimento(mv: Peca.Move, t: int) -> Peca.Move:
+    org = transformar_pos(mv.org, t) if mv.org is not None else None
+    return Peca.Move(mv.tipo, mv.size, org, transformar_pos(mv.dst, t))
+
+def destransformar_movimento(mv: Peca.Move, t: int) -> Peca.Move: # volta um movimento da forma canonica pro tabuleiro original
+    return transformar_movimento(mv, INVERSA[t])
+
+def transformar_codigo(codigo: int, t: int) -> int:
+    tabela = MASCARA_SIMETRIA[t]
+    res = 0
+    for k in range(0, 54, 9): # as 6 mascaras de jogador/tamanho
+        res |= tabela[codigo >> k & 0x1FF] << k
+    return res
+
+def canonizar_codigo(codigo: int) -> Tuple[int, int]:
+    # forma canonica = menor codigo entre as 8 simetrias, junto com a transformacao que leva ate ela
+    melhor, melhor_t = codigo, 0
+    mascaras = [codigo >> k & 0x1FF for k in range(0, 54, 9)]
+    for t in range(1, 8):
+        tabela = MASCARA_SIMETRIA[t]
+        cod = (tabela[mascaras[0]] | tabela[mascaras[1]] << 9 | tabela[mascaras[2]] << 18
+               | tabela[mascaras[3]] << 27 | tabela[mascaras[4]] << 36 | tabela[mascaras[5]] << 45)
+        if cod < melhor:
+            melhor, melhor_t = cod, t
+    return melhor, melhor_t
+
+
 # uma matriz 3x3 tipo cubo, onde cada posicao pode ficar vazia ou ter até 3 pecas
 class Tabuleiro:
 
@@ -73,6 +225,50 @@ class Tabuleiro:
             Jogador.JOGADOR: {Tamanho.P: 2, Tamanho.M: 2, Tamanho.G: 2},
             Jogador.IA: {Tamanho.P: 2, Tamanho.M: 2, Tamanho.G: 2},
         }
+        self.hash = 0   # zobrist da posicao, atualizado pelo place/slide
+        self.codigo = 0 # posicao inteira num int (ver BIT_PECA), tambem atualizado pelo place/slide
+        # contadores de linha, atualizados so nas linhas das casas que mudam de dono visivel:
+        # cont_linhas[jogador][linha] = quantas casas daquela linha o jogador tem no topo (indice 0 nao usado)
+        # hist_linhas[c1*4 + c2] = quantas linhas tem c1 casas do JOGADOR e c2 da IA no topo
+        # com isso o ganhador e a heuristica viram leitura direta, sem varrer o WIN_LINES
+        self.cont_linhas: List[List[int]] = [[0] * 8 for _ in range(3)]
+        self.hist_linhas: List[int] = [0] * 16
+        self.hist_linhas[0] = 8
+
+    def recalcular(self) -> None: # recalcula hash, codigo e contadores, so precisa se mexer no grid direto
+        h = 0
+        cod = 0
+        for pos in ALL_POS:
+            for peca in self.grid[pos.linha][pos.coluna]:
+                h ^= ZOBRIST[peca.jogador][peca.tamanho][pos.linha * 3 + pos.coluna]
+                cod |= BIT_PECA[peca.jogador][peca.tamanho][pos.linha * 3 + pos.coluna]
+        self.hash = h
+        self.codigo = cod
+        self.cont_linhas = [[0] * 8 for _ in range(3)]
+        self.hist_linhas = [0] * 16
+        for i, linha in enumerate(WIN_LINES):
+            for pos in linha:
+                dono = self.visible_player(pos)
+                if dono is not None:
+                    self.cont_linhas[dono][i] += 1
+            self.hist_linhas[self.cont_linhas[1][i] * 4 + self.cont_linhas[2][i]] += 1
+
+    def _dono(self, linha: int, coluna: int) -> int: # dono visivel da casa, 0 se vazia
+        pecas = self.grid[linha][coluna]
+        return pecas[-1].jogador if pecas else 0
+
+    def _mudar_dono(self, casa: int, antigo: int, novo: int) -> None:
+        if antigo == novo:
+            return
+        c1, c2 = self.cont_linhas[1], self.cont_linhas[2]
+        hist = self.hist_linhas
+        for i in LINHAS_DA_CASA[casa]:
+            hist[c1[i] * 4 + c2[i]] -= 1
+            if antigo:
+                self.cont_linhas[antigo][i] -= 1
+            if novo:
+                self.cont_linhas[novo][i] += 1
+            hist[c1[i] * 4 + c2[i]] += 1
 
     def top(self,pos: Pos) -> Optional[Peca]: # pode ser none se estiver vazio ou retorna a no topo
         pecas = self.grid[pos.linha][pos.coluna]
@@ -90,8 +286,12 @@ class Tabuleiro:
             raise ValueError(f"Jogador {jogador} nao tem mais pecas do tamanho {peca.tamanho} restantes")
         if not self.can_place(peca, pos):
             raise ValueError(f"Nao pode colocar peca {peca} na posicao {pos}")
+        casa = pos.linha * 3 + pos.coluna
+        self._mudar_dono(casa, self._dono(pos.linha, pos.coluna), peca.jogador)
         self.grid[pos.linha][pos.coluna].append(peca)
         self.stock[jogador][peca.tamanho] -= 1
+        self.hash ^= ZOBRIST[peca.jogador][peca.tamanho][casa]
+        self.codigo |= BIT_PECA[peca.jogador][peca.tamanho][casa]
 
     def can_slide (self, org: Pos, dst:Pos) -> bool:
         if org == dst:
@@ -105,14 +305,48 @@ class Tabuleiro:
     def slide (self, org: Pos, dst: Pos) -> None:
         if not self.can_slide(org, dst):
             raise ValueError(f"Nao pode deslizar de {org} para {dst}")
+        c_org, c_dst = org.linha * 3 + org.coluna, dst.linha * 3 + dst.coluna
         peca = self.grid[org.linha][org.coluna].pop()
+        self._mudar_dono(c_org, peca.jogador, self._dono(org.linha, org.coluna))
+        self._mudar_dono(c_dst, self._dono(dst.linha, dst.coluna), peca.jogador)
         self.grid[dst.linha][dst.coluna].append(peca)
+        chaves = ZOBRIST[peca.jogador][peca.tamanho]
+        self.hash ^= chaves[c_org] ^ chaves[c_dst]
+        bits = BIT_PECA[peca.jogador][peca.tamanho]
+        self.codigo ^= bits[c_org] | bits[c_dst]
 
-    def aplicar_movimento(self, jogador: Jogador, mv: Peca.Move) -> None:
+    # devolve um token pra desfazer o movimento depois, assim a busca usa um tabuleiro so sem clonar
+    def aplicar_movimento(self, jogador: Jogador, mv: Peca.Move) -> Tuple[Jogador, Peca.Move]:
         if mv.tipo == "place":
             self.place(jogador, Peca(jogador, mv.size), mv.dst)
         else: #slide
             self.slide(mv.org, mv.dst)
+        return (jogador, mv)
+
+    def desfazer_movimento(self, token: Tuple[Jogador, Peca.Move]) -> None:
+        jogador, mv = token
+        peca = self.grid[mv.dst.linha][mv.dst.coluna].pop() # a peca movida sempre fica no topo do destino
+        chaves = ZOBRIST[peca.jogador][peca.tamanho]
+        bits = BIT_PECA[peca.jogador][peca.tamanho]
+        c_dst = mv.dst.linha * 3 + mv.dst.coluna
+        self._mudar_dono(c_dst, peca.jogador, self._dono(mv.dst.linha, mv.dst.coluna))
+        self.hash ^= chaves[c_dst]
+        self.codigo ^= bits[c_dst]
+        if mv.tipo == "place":
+            self.stock[jogador][peca.tamanho] += 1
+        else: #slide
+            c_org = mv.org.linha * 3 + mv.org.coluna
+            self._mudar_dono(c_org, self._dono(mv.org.linha, mv.org.coluna), peca.jogador)
+            self.grid[mv.org.linha][mv.org.coluna].append(peca)
+            self.hash ^= chaves[c_org]
+            self.codigo ^= bits[c_org]
+
+    def codigo_apos(self, jogador: Jogador, mv: Peca.Move) -> int: # codigo depois do movimento, sem aplicar ele
+        if mv.tipo == "place":
+            return self.codigo | BIT_PECA[jogador][mv.size][mv.dst.linha * 3 + mv.dst.coluna]
+        peca = self.grid[mv.org.linha][mv.org.coluna][-1]
+        bits = BIT_PECA[peca.jogador][peca.tamanho]
+        return self.codigo ^ bits[mv.org.linha * 3 + mv.org.coluna] ^ bits[mv.dst.linha * 3 + mv.dst.coluna]
 
     def clone(self) -> "Tabuleiro":
         nb = Tabuleiro()
@@ -120,34 +354,85 @@ class Tabuleiro:
             for c in range(3):
                 nb.grid[r][c] = list(self.grid[r][c])[:]  # copia a lista de pecas naquela posicao
         nb.stock = {j: dict(tamanhos) for j, tamanhos in self.stock.items()}  # copia o estoque
+        nb.hash = self.hash
+        nb.codigo = self.codigo
+        nb.cont_linhas = [list(c) for c in self.cont_linhas]
+        nb.hist_linhas = list(self.hist_linhas)
+        return nb
+
+    # posicao em texto, as 9 casas por linha separadas por "/" e cada casa com as pecas de baixo pra cima
+    # no mesmo formato do __str__ da Peca ("2" do jogador, "2*" da IA), casa vazia é "-"
+    # ex: "-/-/-/-/13*/-/-/-/2*". o estoque nao precisa ir junto, é o que sobrou fora do tabuleiro
+    def para_texto(self) -> str:
+        casas = []
+        for pos in ALL_POS:
+            pecas = self.grid[pos.linha][pos.coluna]
+            casas.append("".join(str(p) for p in pecas) if pecas else "-")
+        return "/".join(casas)
+
+    @classmethod
+    def de_texto(cls, texto: str) -> "Tabuleiro":
+        casas = texto.strip().split("/")
+        if len(casas) != 9:
+            raise ValueError(f"Posicao invalida, esperava 9 casas separadas por '/': {texto!r}")
+        tab = cls()
+        for pos, casa in zip(ALL_POS, casas):
+            if casa == "-":
+                continue
+            i = 0
+            while i < len(casa):
+                if casa[i] not in "123":
+                    raise ValueError(f"Peca invalida na casa {pos}: {casa!r}")
+                jogador = Jogador.JOGADOR
+                if i + 1 < len(casa) and casa[i + 1] == "*":
+                    jogador = Jogador.IA
+                peca = Peca(jogador, Tamanho(int(casa[i])))
+                pilha = tab.grid[pos.linha][pos.coluna]
+                if pilha and pilha[-1].tamanho >= peca.tamanho:
+                    raise ValueError(f"Pilha invalida na casa {pos}: {casa!r}")
+                if tab.stock[jogador][peca.tamanho] <= 0:
+                    raise ValueError(f"Pecas demais do tamanho {peca.tamanho} pro jogador {jogador}")
+                pilha.append(peca)
+                tab.stock[jogador][peca.tamanho] -= 1
+                i += 2 if jogador == Jogador.IA else 1
+        tab.recalcular()
+        return tab
+
+    def forma_canonica(self) -> Tuple[int, int]: # (codigo canonico, transformacao) ver canonizar_codigo
+        return canonizar_codigo(self.codigo)
+
+    def transformado(self, t: int) -> "Tabuleiro": # copia do tabuleiro com a simetria t aplicada
+        nb = Tabuleiro()
+        for pos in ALL_POS:
+            dst = transformar_pos(pos, t)
+            nb.grid[dst.linha][dst.coluna] = list(self.grid[pos.linha][pos.coluna])
+        nb.stock = {j: dict(tamanhos) for j, tamanhos in self.stock.items()}
+        nb.recalcular()
         return nb
 
     def visible_player(self, pos: Pos) -> Optional[Jogador]:
         top_peca = self.top(pos)
         return top_peca.jogador if top_peca else None
     
-    def movimentos_possiveis(self, jogador: Jogador) -> List[Peca.Move]:
-        moves: List[Peca.Move] = []
-        # place
-        for tamanho in Tamanho:
-            if self.stock[jogador][tamanho] > 0:
-                peca = Peca(jogador, tamanho)
-                for pos in ALL_POS:
-                    if self.can_place(peca, pos):
-                        moves.append(Peca.Move("place", tamanho, None, pos))
-        # slide
-        for org in ALL_POS:
-            if self.top(org) and self.top(org).jogador == jogador:
-                for dst in ALL_POS:
-                    if self.can_slide(org, dst):
-                        moves.append(Peca.Move("slide", None, org, dst))
-        return moves
+    def movimentos_possiveis(self, jogador: Jogador) -> List[Peca.Move]: # gerado pelas tabelas a partir do codigo
+        estoque = self.stock[jogador]
+        return movimentos_do_codigo(self.codigo, jogador, [t for t in Tamanho if estoque[t] > 0])
     
     def ganhador(self) -> Optional[Jogador]:
-        for line in WIN_LINES:
-            players = [self.visible_player(pos) for pos in line]
-            if players[0] is not None and all(p == players[0] for p in players):
-                return players[0]
+        cheias_jogador = self.hist_linhas[3 * 4 + 0] # linhas com as 3 casas do jogador
+        cheias_ia = self.hist_linhas[0 * 4 + 3]
+        if not cheias_jogador and not cheias_ia:
+            return None
+        if not cheias_ia:
+            return Jogador.JOGADOR
+        if not cheias_jogador:
+            return Jogador.IA
+        # os dois fecharam linha (um slide pode descobrir peca do outro), vale a primeira no WIN_LINES
+        for i in range(len(WIN_LINES)):
+            if self.cont_linhas[Jogador.JOGADOR][i] == 3:
+                return Jogador.JOGADOR
+            if self.cont_linhas[Jogador.IA][i] == 3:
+                return Jogador.IA
         return None
     
         
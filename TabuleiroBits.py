@@ -0,0 +1,219 @@
+from __future__ import annotations
+from typing import List, Optional, Tuple, Dict
+
+from Tabuleiro import (Tabuleiro, Jogador, Tamanho, Peca, Pos, ALL_POS, ZOBRIST,
+                       BITS, LINHAS_MASCARAS, movimentos_do_codigo, visiveis_de)
+
+# versao do tabuleiro guardada em inteiros, pra enumerar posicoes a partir do codigo (Tablebase, LivroAberturas)
+# sem montar as pilhas. a busca da IA usa o Tabuleiro, que ja mantem o mesmo codigo e gera os movimentos
+# pelas mesmas tabelas
+# como uma pilha so aceita peca maior em cima de menor, cada casa tem no maximo uma peca de cada tamanho
+# e a ordem da pilha fica implicita pelo tamanho, entao basta saber quais pecas estao em cada casa
+# por isso o tabuleiro inteiro vira 6 mascaras de 9 bits (uma pra cada jogador/tamanho) dentro de um int so:
+#   bit = ((jogador-1)*3 + (tamanho-1))*9 + casa, casa = linha*3 + coluna
+# o estoque fica num segundo int com 2 bits por jogador/tamanho (0 a 2 pecas)
+
+MASCARA_CASAS = 0x1FF # 9 bits, uma por casa
+
+def indice_casa(pos: Pos) -> int:
+    return pos.linha * 3 + pos.coluna
+
+def deslocamento(jogador: Jogador, tamanho: Tamanho) -> int: # onde comeca a mascara daquela peca dentro do int
+    return ((int(jogador) - 1) * 3 + (int(tamanho) - 1)) * 9
+
+def deslocamento_estoque(jogador: Jogador, tamanho: Tamanho) -> int:
+    return ((int(jogador) - 1) * 3 + (int(tamanho) - 1)) * 2
+
+ESTOQUE_INICIAL = sum(2 << deslocamento_estoque(j, t) for j in Jogador for t in Tamanho)
+
+# tabelas pre calculadas pra nao criar objeto nenhum durante a enumeracao
+PECAS: Dict[Tuple[Jogador, Tamanho], Peca] = {(j, t): Peca(j, t) for j in Jogador for t in Tamanho}
+# BITS (casas de cada mascara) vem do Tabuleiro, a geracao de movimentos é a do Tabuleiro.movimentos_do_codigo
+
+def zobrist_de(pecas: int) -> int: # zobrist calculado do zero a partir das mascaras
+    h = 0
+    for j in Jogador:
+        for t in Tamanho:
+            for c in BITS[pecas >> deslocamento(j, t) & MASCARA_CASAS]:
+                h ^= ZOBRIST[j][t][c]
+    return h
+
+def estoque_de(pecas: int) -> int: # estoque pra quem comecou com 2 de cada e so tem as pecas do codigo no tabuleiro
+    estoque = 0
+    for j in Jogador:
+        for t in Tamanho:
+            usadas = (pecas >> deslocamento(j, t) & MASCARA_CASAS).bit_count()
+            estoque |= (2 - usadas) << deslocamento_estoque(j, t)
+    return estoque
+
+# ordem de teste pro topo: do maior pro menor tamanho
+_ORDEM_TOPO: Tuple[Tuple[int, Peca], ...] = tuple(
+    (deslocamento(j, t), PECAS[(j, t)]) for t in (Tamanho.G, Tamanho.M, Tamanho.P) for j in Jogador
+)
+
+
+class TabuleiroBits:
+
+    # mesmos pesos do tabuleiro normal
+    W_TWO_ALIGNED   = Tabuleiro.W_TWO_ALIGNED
+    W_ONE_ALIGNED   = Tabuleiro.W_ONE_ALIGNED
+    W_BLOCK_THREAT  = Tabuleiro.W_BLOCK_THREAT
+    W_CENTER_BONUS  = Tabuleiro.W_CENTER_BONUS
+    WIN_SCORE       = Tabuleiro.WIN_SCORE
+
+    __slots__ = ("pecas", "estoque", "hash")
+
+    def __init__(self, pecas: int = 0, estoque: int = ESTOQUE_INICIAL, hash: Optional[int] = None):
+        self.pecas = pecas      # as 6 mascaras de 9 bits
+        self.estoque = estoque  # 2 bits por jogador/tamanho
+        self.hash = zobrist_de(pecas) if hash is None else hash # mesmo zobrist do Tabuleiro, pra tabela de transposicao servir pros dois
+
+    # conversao de e para o tabuleiro normal, assim o Jogo e o JogoWeb continuam usando o Tabuleiro
+    @classmethod
+    def de_tabuleiro(cls, tab: Tabuleiro) -> "TabuleiroBits":
+        pecas = 0
+        for pos in ALL_POS:
+            for peca in tab.grid[pos.linha][pos.coluna]:
+                pecas |= 1 << (deslocamento(peca.jogador, peca.tamanho) + indice_casa(pos))
+        estoque = 0
+        for j, tamanhos in tab.stock.items():
+            for t, qtd in tamanhos.items():
+                estoque |= qtd << deslocamento_estoque(j, t)
+        return cls(pecas, estoque, tab.hash)
+
+    def para_tabuleiro(self) -> Tabuleiro:
+        tab = Tabuleiro()
+        for pos in ALL_POS:
+            c = indice_casa(pos)
+            for t in Tamanho: # a pilha vai da menor pra maior
+                for j in Jogador:
+                    if self.pecas >> (deslocamento(j, t) + c) & 1:
+                        tab.grid[pos.linha][pos.coluna].append(PECAS[(j, t)])
+        tab.stock = self.stock
+        tab.recalcular()
+        return tab
+
+    @classmethod
+    def de_codigo(cls, pecas: int) -> "TabuleiroBits": # o estoque é o que sobrou fora do tabuleiro
+        return cls(pecas, estoque_de(pecas))
+
+    @property
+    def codigo(self) -> int: # mesmo nome do Tabuleiro.codigo
+        return self.pecas
+
+    @property
+    def stock(self) -> Dict[Jogador, Dict[Tamanho, int]]: # mesmo formato do Tabuleiro.stock, so pra leitura
+        return {j: {t: self.qtd_estoque(j, t) for t in Tamanho} for j in Jogador}
+
+    def qtd_estoque(self, jogador: Jogador, tamanho: Tamanho) -> int:
+        return self.estoque >> deslocamento_estoque(jogador, tamanho) & 3
+
+    def _mascaras(self) -> Tuple[int, int, int, int, int, int]: # P1, M1, G1, P2, M2, G2
+        p = self.pecas
+        return (p & MASCARA_CASAS, p >> 9 & MASCARA_CASAS, p >> 18 & MASCARA_CASAS,
+                p >> 27 & MASCARA_CASAS, p >> 36 & MASCARA_CASAS, p >> 45 & MASCARA_CASAS)
+
+    def visiveis(self) -> Tuple[int, int]: # mascara das casas com topo de cada jogador
+        return visiveis_de(self.pecas)
+
+    def _menores_que(self) -> Tuple[int, int, int, int]:
+        # [t] = casas cujo topo é menor que o tamanho t (vazias contam), ou seja, onde uma peca t pode entrar
+        p1, m1, g1, p2, m2, g2 = self._mascaras()
+        g = g1 | g2
+        gm = g | m1 | m2
+        vazias = ~(gm | p1 | p2) & MASCARA_CASAS
+        return (0, vazias, vazias | ((p1 | p2) & ~gm), ~g & MASCARA_CASAS)
+
+    def _tamanho_topo(self, c: int) -> int: # 0 se vazia
+        p = self.pecas
+        for t in (3, 2, 1):
+            if (p >> ((t - 1) * 9 + c) | p >> ((t + 2) * 9 + c)) & 1:
+                return t
+        return 0
+
+    def top(self, pos: Pos) -> Optional[Peca]:
+        p = self.pecas >> (pos.linha * 3 + pos.coluna)
+        for desl, peca in _ORDEM_TOPO:
+            if p >> desl & 1:
+                return peca
+        return None
+
+    def can_place(self, peca: Peca, pos: Pos) -> bool:
+        return bool(self._menores_que()[peca.tamanho] >> indice_casa(pos) & 1)
+
+    def place(self, jogador: Jogador, peca: Peca, pos: Pos) -> None:
+        if self.qtd_estoque(jogador, peca.tamanho) <= 0:
+            raise ValueError(f"Jogador {jogador} nao tem mais pecas do tamanho {peca.tamanho} restantes")
+        if not self.can_place(peca, pos):
+            raise ValueError(f"Nao pode colocar peca {peca} na posicao {pos}")
+        c = indice_casa(pos)
+        self.pecas |= 1 << (deslocamento(jogador, peca.tamanho) + c)
+        self.estoque -= 1 << deslocamento_estoque(jogador, peca.tamanho)
+        self.hash ^= ZOBRIST[jogador][peca.tamanho][c]
+
+    def can_slide(self, org: Pos, dst: Pos) -> bool:
+        if org == dst:
+            return False
+        t = self._tamanho_topo(indice_casa(org))
+        if t == 0: # origem vazia
+            return False
+        return bool(self._menores_que()[t] >> indice_casa(dst) & 1)
+
+    def slide(self, org: Pos, dst: Pos) -> None:
+        if not self.can_slide(org, dst):
+            raise ValueError(f"Nao pode deslizar de {org} para {dst}")
+        peca = self.top(org)
+        base = deslocamento(peca.jogador, peca.tamanho)
+        c_org, c_dst = indice_casa(org), indice_casa(dst)
+        self.pecas ^= (1 << (base + c_org)) | (1 << (base + c_dst))
+        chaves = ZOBRIST[peca.jogador][peca.tamanho]
+        self.hash ^= chaves[c_org] ^ chaves[c_dst]
+
+    # o token de desfazer é so o estado anterior, que sao tres ints
+    def aplicar_movimento(self, jogador: Jogador, mv: Peca.Move) -> Tuple[int, int, int]:
+        token = (self.pecas, self.estoque, self.hash)
+        if mv.tipo == "place":
+            self.place(jogador, PECAS[(jogador, mv.size)], mv.dst)
+        else: #slide
+            self.slide(mv.org, mv.dst)
+        return token
+
+    def desfazer_movimento(self, token: Tuple[int, int, int]) -> None:
+        self.pecas, self.estoque, self.hash = token
+
+    def codigo_apos(self, jogador: Jogador, mv: Peca.Move) -> int: # mesmo do Tabuleiro.codigo_apos
+        if mv.tipo == "place":
+            return self.pecas | 1 << (deslocamento(jogador, mv.size) + indice_casa(mv.dst))
+        peca = self.top(mv.org)
+        base = deslocamento(peca.jogador, peca.tamanho)
+        return self.pecas ^ (1 << (base + indice_casa(mv.org))) ^ (1 << (base + indice_casa(mv.dst)))
+
+    def clone(self) -> "TabuleiroBits":
+        return TabuleiroBits(self.pecas, self.estoque, self.hash)
+
+    def visible_player(self, pos: Pos) -> Optional[Jogador]:
+        vis1, vis2 = self.visiveis()
+        c = indice_casa(pos)
+        if vis1 >> c & 1:
+            return Jogador.JOGADOR
+        if vis2 >> c & 1:
+            return Jogador.IA
+        return None
+
+    def movimentos_possiveis(self, jogador: Jogador) -> List[Peca.Move]: # mesma geracao por tabelas do Tabuleiro
+        est = self.estoque >> deslocamento_estoque(jogador, Tamanho.P)
+        return movimentos_do_codigo(self.pecas, jogador, [t for t in Tamanho if est >> ((t - 1) * 2) & 3])
+
+    def ganhador(self) -> Optional[Jogador]:
+        vis1, vis2 = self.visiveis()
+        for linha in LINHAS_MASCARAS: # mesma ordem do WIN_LINES, se os dois fecharem linha ganha o da primeira
+            if vis1 & linha == linha:
+                return Jogador.JOGADOR
+            if vis2 & linha == linha:
+                return Jogador.IA
+        return None
+
+    def acabou(self) -> bool:
+        return self.ganhador() is not None
+
+    imprimir_tabuleiro = Tabuleiro.imprimir_tabuleiro
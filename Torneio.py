@@ -0,0 +1,234 @@
+from __future__ import annotations
+import argparse
+import ast
+import itertools
+import json
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from Tabuleiro import Tabuleiro, Jogador, REPETICOES_EMPATE, chave_repeticao
+from IA import IA_Minimax
+
+# torneio entre configuracoes da IA_Minimax jogando sozinhas, sem input nem print
+# todo par joga as mesmas aberturas duas vezes trocando quem comeca, as partidas rodam em paralelo num pool de processos
+# no fim sai o elo de cada configuracao junto com nos/s e tempo por lance, pra comparar forca por segundo de cpu
+
+# motivos de fim de partida
+VITORIA = "vitoria"
+REPETICAO = "repeticao" # mesma posicao com a mesma vez REPETICOES_EMPATE vezes, empate
+LIMITE = "limite"       # passou do maximo de lances, empate
+TRAVADO = "travado"     # nenhum dos dois tem movimento, empate
+
+_ELO_BASE = 1500.0
+
+
+def _oponente(j: Jogador) -> Jogador:
+    return Jogador.IA if j == Jogador.JOGADOR else Jogador.JOGADOR
+
+
+def jogar_partida(config_a: Dict[str, Any], config_b: Dict[str, Any], a_comeca: bool,
+                  semente_abertura: int = 0, lances_abertura: int = 2, max_lances: int = 200) -> Dict[str, Any]:
+    # a joga com Jogador.JOGADOR se comeca, senao com Jogador.IA. os primeiros lances_abertura lances sao sorteados
+    # com a semente, senao duas IAs deterministicas jogariam sempre a mesma partida
+    lado_a = Jogador.JOGADOR if a_comeca else Jogador.IA
+    ias = {
+        lado_a: IA_Minimax(**{**config_a, "verbose": False}),
+        _oponente(lado_a): IA_Minimax(**{**config_b, "verbose": False}),
+    }
+    # tempo é de relogio (o que o jogador espera), cpu é process_time do processo que jogou. com partidas em paralelo
+    # o relogio cresce com a disputa pelos nucleos e o cpu nao, entao a comparacao de forca por segundo usa o cpu
+    stats = {j: {"lances": 0, "nos": 0, "tempo": 0.0, "tempo_max": 0.0, "cpu": 0.0} for j in ias}
+    rng = random.Random(semente_abertura)
+    tab = Tabuleiro()
+    vez = Jogador.JOGADOR
+    vistas: Dict[int, int] = {}
+    motivo = LIMITE
+    vencedor: Optional[Jogador] = None
+    lances = 0
+    passes = 0
+    try:
+        while lances < max_lances:
+            chave = chave_repeticao(tab.codigo, vez)
+            vistas[chave] = vistas.get(chave, 0) + 1
+            if vistas[chave] >= REPETICOES_EMPATE:
+                motivo = REPETICAO
+                break
+
+            movimentos = tab.movimentos_possiveis(vez)
+            if not movimentos: # sem movimento passa a vez, se os dois passarem seguido ninguem sai do lugar
+                passes += 1
+                if passes == 2:
+                    motivo = TRAVADO
+                    break
+                vez = _oponente(vez)
+                continue
+            passes = 0
+
+            if lances < lances_abertura:
+                mv = rng.choice(movimentos)
+            else:
+                t0 = time.perf_counter()
+                c0 = time.process_time()
+                mv = ias[vez].obter_melhor_movimento(tab, vez, vistas)
+                cpu = time.process_time() - c0
+                dt = time.perf_counter() - t0
+                s = stats[vez]
+                s["lances"] += 1
+                s["nos"] += ias[vez].nos_avaliados
+                s["tempo"] += dt
+                s["cpu"] += cpu
+                s["tempo_max"] = max(s["tempo_max"], dt)
+            tab.aplicar_movimento(vez, mv)
+            lances += 1
+
+            vencedor = tab.ganhador()
+            if vencedor is not None:
+                motivo = VITORIA
+                break
+            vez = _oponente(vez)
+    finally:
+        for ia in ias.values():
+            ia.fechar()
+
+    pontos_a = 0.5 if vencedor is None else (1.0 if vencedor == lado_a else 0.0)
+    return {
+        "a_comeca": a_comeca,
+        "semente_abertura": semente_abertura,
+        "pontos_a": pontos_a,
+        "motivo": motivo,
+        "lances": lances,
+        "stats_a": stats[lado_a],
+        "stats_b": stats[_oponente(lado_a)],
+    }
+
+
+def _jogar(args: Tuple[str, str, Dict[str, Any], Dict[str, Any], bool, int, int, int]) -> Dict[str, Any]:
+    nome_a, nome_b, config_a, config_b, a_comeca, semente, lances_abertura, max_lances = args
+    resultado = jogar_partida(config_a, config_b, a_comeca, semente, lances_abertura, max_lances)
+    resultado["a"] = nome_a
+    resultado["b"] = nome_b
+    return resultado
+
+
+def calcular_elo(nomes: List[str], partidas: List[Dict[str, Any]], iteracoes: int = 500) -> Dict[str, float]:
+    # maxima verossimilhanca do modelo de elo por subida de gradiente. cada configuracao ganha um empate virtual
+    # contra a media, senao quem ganhou todas as partidas iria pro infinito. a media dos elos fica em _ELO_BASE
+    elo = {n: 0.0 for n in nomes}
+    jogos = {n: 1 for n in nomes}
+    for p in partidas:
+        jogos[p["a"]] += 1
+        jogos[p["b"]] += 1
+
+    def esperado(ra: float, rb: float) -> float:
+        return 1.0 / (1.0 + 10 ** ((rb - ra) / 400.0))
+
+    for _ in range(iteracoes):
+        gradiente = {n: 0.5 - esperado(elo[n], 0.0) for n in nomes}
+        for p in partidas:
+            e = esperado(elo[p["a"]], elo[p["b"]])
+            gradiente[p["a"]] += p["pontos_a"] - e
+            gradiente[p["b"]] -= p["pontos_a"] - e
+        for n in nomes:
+            elo[n] += 400.0 * gradiente[n] / jogos[n]
+        media = sum(elo.values()) / len(elo)
+        elo = {n: r - media for n, r in elo.items()}
+    return {n: _ELO_BASE + r for n, r in elo.items()}
+
+
+def torneio(configs: Dict[str, Dict[str, Any]], aberturas: int = 4, workers: int = 1, semente: int = 0,
+            lances_abertura: int = 2, max_lances: int = 200) -> Dict[str, Any]:
+    # todos contra todos, cada abertura jogada duas vezes por par (cada um comeca uma)
+    if len(configs) < 2:
+        raise ValueError("O torneio precisa de pelo menos duas configuracoes")
+    nomes = list(configs)
+    tarefas = []
+    for a, b in itertools.combinations(nomes, 2):
+        for k in range(aberturas):
+            for a_comeca in (True, False):
+                tarefas.append((a, b, configs[a], configs[b], a_comeca, semente * 1_000_003 + k, lances_abertura, max_lances))
+
+    t0 = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            partidas = list(pool.map(_jogar, tarefas))
+    else:
+        partidas = [_jogar(t) for t in tarefas]
+    tempo_total = time.perf_counter() - t0
+
+    elo = calcular_elo(nomes, partidas)
+    tabela = {}
+    for n in nomes:
+        lances = nos = 0
+        tempo = tempo_max = cpu = 0.0
+        pontos = 0.0
+        jogos = 0
+        for p in partidas:
+            for lado, s in (("a", p["stats_a"]), ("b", p["stats_b"])):
+                if p[lado] != n:
+                    continue
+                jogos += 1
+                pontos += p["pontos_a"] if lado == "a" else 1.0 - p["pontos_a"]
+                lances += s["lances"]
+                nos += s["nos"]
+                tempo += s["tempo"]
+                cpu += s["cpu"]
+                tempo_max = max(tempo_max, s["tempo_max"])
+        tabela[n] = {
+            "config": configs[n],
+            "elo": elo[n],
+            "partidas": jogos,
+            "pontos": pontos,
+            "nos_por_segundo": nos / cpu if cpu else 0.0, # por segundo de cpu
+            "tempo_medio_lance": tempo / lances if lances else 0.0,
+            "tempo_max_lance": tempo_max,
+            "tempo_cpu": cpu,
+        }
+
+    motivos: Dict[str, int] = {}
+    for p in partidas:
+        motivos[p["motivo"]] = motivos.get(p["motivo"], 0) + 1
+    return {"configs": tabela, "partidas": partidas, "motivos": motivos, "tempo_total": tempo_total}
+
+
+def ler_config(txt: str) -> Tuple[str, Dict[str, Any]]:
+    # "nome:chave=valor,chave=valor" com os argumentos do IA_Minimax, ex: "p3:profundidade_maxima=3,limite_tempo=5"
+    nome, _, resto = txt.partition(":")
+    config: Dict[str, Any] = {}
+    for par in filter(None, resto.split(",")):
+        chave, _, valor = par.partition("=")
+        try:
+            config[chave.strip()] = ast.literal_eval(valor.strip())
+        except (ValueError, SyntaxError):
+            config[chave.strip()] = valor.strip()
+    return nome.strip(), config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Torneio entre configuracoes da IA, com elo e nos/s")
+    parser.add_argument("--ia", action="append", required=True,
+                        help="configuracao 'nome:chave=valor,...' com os argumentos do IA_Minimax (repita pra cada uma)")
+    parser.add_argument("--aberturas", type=int, default=4, help="aberturas sorteadas por par, cada uma jogada com as duas cores")
+    parser.add_argument("--lances-abertura", type=int, default=2)
+    parser.add_argument("--max-lances", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=1, help="partidas em paralelo")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--json", help="salva o resultado completo nesse arquivo")
+    args = parser.parse_args()
+
+    configs = dict(ler_config(c) for c in args.ia)
+    r = torneio(configs, args.aberturas, args.workers, args.semente, args.lances_abertura, args.max_lances)
+
+    print(f"{len(r['partidas'])} partidas em {r['tempo_total']:.1f}s, fim por: {r['motivos']}")
+    print(f"{'config':<12} {'elo':>6} {'pontos':>9} {'nos/s':>9} {'t medio':>8} {'t max':>7} {'cpu (s)':>8}")
+    for nome, c in sorted(r["configs"].items(), key=lambda kv: -kv[1]["elo"]):
+        print(f"{nome:<12} {c['elo']:>6.0f} {c['pontos']:>4.1f}/{c['partidas']:<4} {c['nos_por_segundo']:>9.0f} "
+              f"{c['tempo_medio_lance']:>8.3f} {c['tempo_max_lance']:>7.3f} {c['tempo_cpu']:>8.1f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(r, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+from __future__ import annotations
+from typing import List, Optional, Tuple, Dict, Any
+
+from Tabuleiro import Peca
+
+# tabela de transposicao da IA: guarda o resultado de posicoes ja buscadas, indexada pelo zobrist
+# cada entrada é (chave, profundidade, tipo, score, melhor movimento, geracao)
+
+# tipo do score guardado
+EXATO = 0     # valor exato
+INFERIOR = 1  # valor real >= score (teve corte beta)
+SUPERIOR = 2  # valor real <= score (nenhum movimento passou do alfa)
+
+Entrada = Tuple[int, int, int, float, Optional[Peca.Move], int]
+
+
+class TabelaTransposicao:
+
+    # estimativa do custo de uma entrada em python: a tupla de 6 itens, o int de 64 bits da chave,
+    # o float do score e o ponteiro na lista. da pra medir com sys.getsizeof se mudar o formato
+    BYTES_POR_ENTRADA = 160
+
+    def __init__(self, tamanho_mb: float = 16.0):
+        self.tamanho_mb = tamanho_mb
+        self.num_entradas = max(1, int(tamanho_mb * 1024 * 1024) // self.BYTES_POR_ENTRADA)
+        self.entradas: List[Optional[Entrada]] = [None] * self.num_entradas
+        self.geracao = 0 # muda a cada busca, entrada de busca velha pode ser substituida sempre
+        self.ocupadas = 0
+        self.zerar_estatisticas()
+
+    def zerar_estatisticas(self) -> None:
+        self.sondagens = 0
+        self.acertos = 0  # achou a posicao na tabela
+        self.cortes = 0   # o acerto ja resolveu o no sem precisar buscar
+        self.gravacoes = 0
+        self.substituicoes = 0
+
+    def nova_busca(self) -> None:
+        self.geracao += 1
+
+    def limpar(self) -> None:
+        self.entradas = [None] * self.num_entradas
+        self.ocupadas = 0
+
+    def sondar(self, chave: int) -> Optional[Entrada]:
+        self.sondagens += 1
+        entrada = self.entradas[chave % self.num_entradas]
+        if entrada is not None and entrada[0] == chave:
+            self.acertos += 1
+            return entrada
+        return None
+
+    def registrar_corte(self) -> None:
+        self.cortes += 1
+
+    # politica de substituicao com preferencia por profundidade:
+    # so tira uma entrada da busca atual se a nova for pelo menos tao profunda
+    def gravar(self, chave: int, profundidade: int, tipo: int, score: float, mv: Optional[Peca.Move]) -> None:
+        i = chave % self.num_entradas
+        velha = self.entradas[i]
+        if velha is None:
+            self.ocupadas += 1
+        elif velha[5] == self.geracao and profundidade < velha[1]:
+            return
+        elif velha[0] != chave:
+            self.substituicoes += 1
+        self.entradas[i] = (chave, profundidade, tipo, score, mv, self.geracao)
+        self.gravacoes += 1
+
+    def estatisticas(self) -> Dict[str, Any]:
+        return {
+            'tamanho_mb': self.tamanho_mb,
+            'entradas': self.num_entradas,
+            'ocupacao': self.ocupadas / self.num_entradas,
+            'sondagens': self.sondagens,
+            'acertos': self.acertos,
+            'cortes': self.cortes,
+            'taxa_acerto': self.acertos / self.sondagens if self.sondagens else 0.0,
+            'taxa_corte': self.cortes / self.sondagens if self.sondagens else 0.0,
+            'gravacoes': self.gravacoes,
+            'substituicoes': self.substituicoes,
+        }
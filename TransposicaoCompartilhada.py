@@ -0,0 +1,118 @@
+from __future__ import annotations
+from multiprocessing import shared_memory
+from typing import Optional, Dict, Any
+
+from Tabuleiro import Peca, MOVIMENTOS, CODIGO_MOVIMENTO
+from Transposicao import Entrada
+
+# tabela de transposicao em memoria compartilhada, pra varios processos buscarem juntos (lazy smp)
+# mesma interface da TabelaTransposicao, mas cada entrada sao 2 palavras de 64 bits no buffer compartilhado:
+#   [chave ^ dados, dados]
+# nao tem lock: se dois processos escreverem no mesmo slot ao mesmo tempo e a leitura pegar metade de cada,
+# a chave recuperada (palavra0 ^ palavra1) nao bate e a entrada é so ignorada
+#
+# dados: score*1000 + 2^31 (32 bits) | profundidade (8) | tipo (2) | movimento (7, CODIGO_MOVIMENTO) | geracao (6)
+# o score é guardado em ponto fixo com 3 casas: a heuristica é inteira, mas o empate vale -contempt e o contempt
+# pode ser fracionario. com 32 bits cabe ate +-2147483.647, muito acima do WIN_SCORE
+
+_BITS_GERACAO = 6
+_MASCARA_GERACAO = (1 << _BITS_GERACAO) - 1
+_DESLOC_SCORE = 1 << 31
+_ESCALA_SCORE = 1000
+_M64 = (1 << 64) - 1
+
+
+def _empacotar(profundidade: int, tipo: int, score: float, mv: Optional[Peca.Move], geracao: int) -> int:
+    fixo = round(score * _ESCALA_SCORE)
+    if not -_DESLOC_SCORE <= fixo < _DESLOC_SCORE:
+        raise ValueError(f"Score fora do que a tabela compartilhada guarda: {score}")
+    return ((fixo + _DESLOC_SCORE) << 32
+            | min(profundidade, 255) << 24
+            | tipo << 22
+            | (CODIGO_MOVIMENTO[mv] if mv is not None else 0) << 15
+            | (geracao & _MASCARA_GERACAO))
+
+
+class TabelaCompartilhada:
+
+    BYTES_POR_ENTRADA = 16
+
+    # sem nome cria o bloco de memoria (e é dono dele), com nome abre um que ja existe
+    def __init__(self, tamanho_mb: float = 16.0, nome: Optional[str] = None):
+        self.tamanho_mb = tamanho_mb
+        self.num_entradas = max(1, int(tamanho_mb * 1024 * 1024) // self.BYTES_POR_ENTRADA)
+        self.dono = nome is None
+        if self.dono:
+            self._shm = shared_memory.SharedMemory(create=True, size=self.num_entradas * self.BYTES_POR_ENTRADA)
+            self._shm.buf[:] = bytes(len(self._shm.buf))
+        else:
+            self._shm = shared_memory.SharedMemory(name=nome)
+        self.nome = self._shm.name
+        self._palavras = self._shm.buf.cast("Q")
+        self.geracao = 0
+        self.ocupadas = 0 # so as que este processo ocupou, a tabela é dividida
+        self.zerar_estatisticas()
+
+    def zerar_estatisticas(self) -> None:
+        self.sondagens = 0
+        self.acertos = 0
+        self.cortes = 0
+        self.gravacoes = 0
+        self.substituicoes = 0
+
+    def nova_busca(self) -> None:
+        self.geracao += 1
+
+    def limpar(self) -> None:
+        self._palavras[:] = memoryview(bytes(len(self._shm.buf))).cast("Q")
+        self.ocupadas = 0
+
+    def sondar(self, chave: int) -> Optional[Entrada]:
+        self.sondagens += 1
+        i = (chave % self.num_entradas) << 1
+        dados = self._palavras[i + 1]
+        if dados == 0 or self._palavras[i] ^ dados != chave: # vazio, outra posicao ou escrita pela metade
+            return None
+        self.acertos += 1
+        return (chave, (dados >> 24) & 0xFF, (dados >> 22) & 3, ((dados >> 32) - _DESLOC_SCORE) / _ESCALA_SCORE,
+                MOVIMENTOS[(dados >> 15) & 0x7F], dados & _MASCARA_GERACAO)
+
+    def registrar_corte(self) -> None:
+        self.cortes += 1
+
+    # mesma politica da TabelaTransposicao, preferencia por profundidade dentro da busca atual
+    def gravar(self, chave: int, profundidade: int, tipo: int, score: float, mv: Optional[Peca.Move]) -> None:
+        chave &= _M64
+        i = (chave % self.num_entradas) << 1
+        dados_velhos = self._palavras[i + 1]
+        chave_velha = self._palavras[i] ^ dados_velhos
+        if chave_velha == 0 and dados_velhos == 0:
+            self.ocupadas += 1
+        elif (dados_velhos & _MASCARA_GERACAO) == (self.geracao & _MASCARA_GERACAO) and profundidade < ((dados_velhos >> 24) & 0xFF):
+            return
+        elif chave_velha != chave:
+            self.substituicoes += 1
+        dados = _empacotar(profundidade, tipo, score, mv, self.geracao)
+        self._palavras[i] = chave ^ dados
+        self._palavras[i + 1] = dados
+        self.gravacoes += 1
+
+    def estatisticas(self) -> Dict[str, Any]:
+        return {
+            'tamanho_mb': self.tamanho_mb,
+            'entradas': self.num_entradas,
+            'ocupacao': self.ocupadas / self.num_entradas,
+            'sondagens': self.sondagens,
+            'acertos': self.acertos,
+            'cortes': self.cortes,
+            'taxa_acerto': self.acertos / self.sondagens if self.sondagens else 0.0,
+            'taxa_corte': self.cortes / self.sondagens if self.sondagens else 0.0,
+            'gravacoes': self.gravacoes,
+            'substituicoes': self.substituicoes,
+        }
+
+    def fechar(self) -> None: # o dono tambem apaga o bloco, os outros processos so soltam
+        self._palavras.release()
+        self._shm.close()
+        if self.dono:
+            self._shm.unlink()